@@ -23,6 +23,8 @@ def _process_and_save(a_min, a_max, g):
     }
     print(json.dumps(calibration, indent=4))
     redis_connection.set("a_offset", json.dumps(a_offset))
+    redis_connection.set("calibration_updated", 1)
+    redis_connection.publish("calibration_updated", 1)
     print("saved a_offset to Redis.")
 
 
@@ -1,4 +1,6 @@
 #!venv/bin/python3
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
@@ -7,8 +9,34 @@ from fastapi.responses import RedirectResponse
 import routers.offline_map as offline_map
 import routers.datasets as datasets
 import routers.sensors as sensors
+from gebco import Gebco
+from redis_hub import RedisHub
+from mag_calibration import MagnetometerCalibration
 
-app = FastAPI()
+# memory budget for decoded GEBCO elevation blocks shared by all requests.
+GEBCO_CACHE_MB = int(os.environ.get("GEBCO_CACHE_MB", 64))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        app.state.gebco = Gebco(cache_bytes=GEBCO_CACHE_MB * 2**20)
+    except FileNotFoundError:
+        app.state.gebco = None
+    app.state.redis_hub = RedisHub(sensors.redis_host)
+    app.state.redis_hub.keep_latest(*sensors.LATEST_VALUE_CHANNELS)
+    app.state.magnetometer_calibration = MagnetometerCalibration(
+        app.state.redis_hub
+    )
+    app.state.magnetometer_calibration.start()
+    yield
+    await app.state.magnetometer_calibration.stop()
+    await app.state.redis_hub.close()
+    if app.state.gebco is not None:
+        app.state.gebco.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="../static"), name="static")
 if Path("../fonts").is_dir():
@@ -5,20 +5,24 @@ import redis
 from bme280 import Bme280
 from bmp280 import Bmp280
 from bmp388 import Bmp388
+from transport import publish_message
 
 
-def get_barometer_sensor():
-    """Attempt to initialize each barometer sensor in turn."""
+def get_barometer_sensor(bus=None, fifo=False):
+    """
+    Attempt to initialize each barometer sensor in turn. The FIFO is only
+    supported by the BMP388.
+    """
     try:
-        return Bme280()
+        return Bme280(bus=bus)
     except Exception:
         print("no BME280 found")
     try:
-        return Bmp280()
+        return Bmp280(bus=bus)
     except Exception:
         print("no BMP280 found")
     try:
-        return Bmp388()
+        return Bmp388(bus=bus, fifo=fifo)
     except Exception:
         print("no BMP388 found")
 
@@ -34,7 +38,7 @@ def main():
     while True:
         t_start = time.time()
         sensor_data = sensor.get_sensor_data()
-        redis_connection.publish("barometer", json.dumps(sensor_data))
+        publish_message(redis_connection, "barometer", json.dumps(sensor_data))
         dt = time.time() - t_start
         time.sleep(max(0, interval - dt))
 
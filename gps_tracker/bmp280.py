@@ -9,16 +9,18 @@ class DeviceNotFound(IOError):
 
 
 class Bmp280:
-    def __init__(self, i2c_address=0x77):
+    def __init__(self, i2c_address=0x77, bus=None):
         self.i2c_address = i2c_address
+        self.bus = bus
         self.initialize_sensor()
         self.hostname = socket.gethostname()
         # ensure that the sensor is really initialized to avoid false data?
         self.initialize_sensor()
 
     def initialize_sensor(self):
-        # Get I2C bus
-        self.bus = smbus2.SMBus(1)
+        # Get I2C bus unless a shared one was given
+        if self.bus is None:
+            self.bus = smbus2.SMBus(1)
         chip_id = self.bus.read_byte_data(self.i2c_address, 0xD0)
         if chip_id != 0x58:
             raise DeviceNotFound("No BMP280 found.")
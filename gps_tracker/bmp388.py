@@ -2,6 +2,7 @@
 import smbus2
 import time
 import socket
+import numpy as np
 
 I2C_ADD_BMP388_AD0_LOW = 0x76
 I2C_ADD_BMP388_AD0_HIGH = 0x77
@@ -25,6 +26,37 @@ BMP388_REG_VAL_EXTMODE_EN = 0x34
 BMP388_REG_VAL_FIFI_FLUSH = 0xB0
 BMP388_REG_VAL_SOFT_RESET = 0xB6
 
+BMP388_REG_ADD_FIFO_LENGTH = 0x12
+BMP388_REG_ADD_FIFO_DATA = 0x14
+BMP388_REG_ADD_FIFO_CONFIG_1 = 0x17
+# FIFO enabled, not stopping when full, with sensor time, pressure and
+# temperature frames.
+BMP388_REG_VAL_FIFO_CONFIG_1 = 0x1D
+BMP388_REG_ADD_FIFO_CONFIG_2 = 0x18
+# filtered data without subsampling.
+BMP388_REG_VAL_FIFO_CONFIG_2 = 0x08
+
+# FIFO frame headers and the number of bytes following them.
+FIFO_FRAME_PRESS_TEMP = 0x94
+FIFO_FRAME_TEMP = 0x90
+FIFO_FRAME_PRESS = 0x84
+FIFO_FRAME_TIME = 0xA0
+FIFO_FRAME_EMPTY = 0x80
+FIFO_FRAME_SIZES = {
+    FIFO_FRAME_PRESS_TEMP: 6,
+    FIFO_FRAME_TEMP: 3,
+    FIFO_FRAME_PRESS: 3,
+    FIFO_FRAME_TIME: 3,
+    # configuration change and configuration error frames.
+    0x48: 1,
+    0x44: 1,
+}
+FIFO_SIZE = 512
+# the sensor time counts in steps of 39.0625 microseconds.
+SENSOR_TIME_TICK = 1 / 25600
+# output data rate of 12.5Hz as configured in initialize_sensor.
+ODR_PERIOD = 0.08
+
 BMP388_REG_ADD_PWR_CTRL = 0x1B
 BMP388_REG_VAL_PRESS_EN = 0x01
 BMP388_REG_VAL_TEMP_EN = 0x02
@@ -65,16 +97,19 @@ class DeviceNotFound(IOError):
 
 
 class Bmp388:
-    def __init__(self, i2c_address=I2C_ADD_BMP388):
+    def __init__(self, i2c_address=I2C_ADD_BMP388, bus=None, fifo=False):
         self.i2c_address = i2c_address
+        self.bus = bus
+        self.fifo = fifo
         self.initialize_sensor()
         self.hostname = socket.gethostname()
         # ensure that the sensor is really initialized to avoid false data?
         self.initialize_sensor()
 
     def initialize_sensor(self):
-        # Get I2C bus
-        self.bus = smbus2.SMBus(1)
+        # Get I2C bus unless a shared one was given
+        if self.bus is None:
+            self.bus = smbus2.SMBus(1)
         # Load calibration values.
         if self._read_byte(BMP388_REG_ADD_WIA) == BMP388_REG_VAL_WIA:
             u8RegData = self._read_byte(BMP388_REG_ADD_STATUS)
@@ -96,6 +131,14 @@ class Bmp388:
         # set IIR filter to filter coefficient 3.
         self._write_byte(0x1F, 0x04)
         self._load_calibration()
+        if self.fifo:
+            self._write_byte(
+                BMP388_REG_ADD_FIFO_CONFIG_1, BMP388_REG_VAL_FIFO_CONFIG_1
+            )
+            self._write_byte(
+                BMP388_REG_ADD_FIFO_CONFIG_2, BMP388_REG_VAL_FIFO_CONFIG_2
+            )
+            self._write_byte(BMP388_REG_ADD_CMD, BMP388_REG_VAL_FIFI_FLUSH)
         time.sleep(0.5)
 
     def _read_byte(self, cmd):
@@ -204,3 +247,78 @@ class Bmp388:
             "p_hostname": self.hostname,
             "p_sensor": "BMP388",
         }
+
+    def _read_fifo(self):
+        """
+        reads the filled part of the FIFO and the sensor time frame appended
+        after the last sample in a single I2C transaction.
+        """
+        length = self.bus.read_i2c_block_data(
+            self.i2c_address, BMP388_REG_ADD_FIFO_LENGTH, 2
+        )
+        length = min(((length[1] & 0x01) << 8) + length[0], FIFO_SIZE)
+        write = smbus2.i2c_msg.write(
+            self.i2c_address, [BMP388_REG_ADD_FIFO_DATA]
+        )
+        read = smbus2.i2c_msg.read(
+            self.i2c_address, length + 1 + FIFO_FRAME_SIZES[FIFO_FRAME_TIME]
+        )
+        self.bus.i2c_rdwr(write, read)
+        return time.time(), bytes(read)
+
+    @staticmethod
+    def parse_fifo(data):
+        """
+        returns the raw temperature and pressure values of the complete
+        frames as arrays and the sensor time or None if it was not read.
+        """
+        adc_t = []
+        adc_p = []
+        sensor_time = None
+        i = 0
+        while i < len(data):
+            header = data[i]
+            size = FIFO_FRAME_SIZES.get(header)
+            if size is None or i + 1 + size > len(data):
+                break
+            frame = data[i + 1 : i + 1 + size]
+            if header == FIFO_FRAME_PRESS_TEMP:
+                # the temperature is stored before the pressure.
+                adc_t.append(int.from_bytes(frame[:3], "little"))
+                adc_p.append(int.from_bytes(frame[3:], "little"))
+            elif header == FIFO_FRAME_TIME:
+                sensor_time = int.from_bytes(frame, "little")
+            i += 1 + size
+        return (
+            np.array(adc_t, dtype=float),
+            np.array(adc_p, dtype=float),
+            sensor_time,
+        )
+
+    def get_fifo_data(self):
+        """
+        drains the FIFO and returns its samples ordered by time. The samples
+        are taken every ODR_PERIOD. The sensor time tells how long ago the
+        latest one was taken.
+        """
+        timestamp, data = self._read_fifo()
+        adc_t, adc_p, sensor_time = self.parse_fifo(data)
+        if len(adc_t) == 0:
+            return []
+        temperature = self.compensate_temperature(adc_t) / 100
+        pressure = self.compensate_pressure(adc_p) / 100
+        if sensor_time is not None:
+            timestamp -= (sensor_time * SENSOR_TIME_TICK) % ODR_PERIOD
+        timestamps = timestamp - ODR_PERIOD * np.arange(len(adc_t))[::-1]
+        return [
+            {
+                "temperature": round(_temperature, 3),
+                "pressure": round(_pressure, 2),
+                "p_utc": round(_timestamp, 3),
+                "p_hostname": self.hostname,
+                "p_sensor": "BMP388",
+            }
+            for _temperature, _pressure, _timestamp in zip(
+                temperature.tolist(), pressure.tolist(), timestamps.tolist()
+            )
+        ]
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class ByteLRUCache:
+    """
+    thread-safe LRU cache limited by the total size of its values in bytes.
+    The size of each value has to be given when it is stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        returns the cached value or MISSING if the key is not cached.
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return MISSING
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            old_item = self._items.pop(key, None)
+            if old_item is not None:
+                self.current_bytes -= old_item[1]
+            self._items[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, _size) = self._items.popitem(last=False)
+                self.current_bytes -= _size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "items": len(self._items),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / requests, 4) if requests else None,
+            }
@@ -0,0 +1,292 @@
+#!venv/bin/python3
+import json
+import shutil
+import sys
+from pathlib import Path
+import numpy as np
+
+columnar_directory = Path("../logs_columnar")
+HEADER_FILE = "header.json"
+# version 2 adds the state of each value to fields which are not complete.
+FORMAT_VERSION = 2
+# states of the values of a field, stored in {file}.state.npy.
+STATE_MISSING = 0
+STATE_NULL = 1
+STATE_VALUE = 2
+# marks values which are omitted from their row.
+_MISSING = object()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _to_column(values):
+    """
+    converts the values of a field into a NumPy array. Returns the column
+    description and the array or None if the values cannot be stored.
+    """
+    present = [_value for _value in values if _value is not None]
+    complete = len(present) == len(values)
+    if not present:
+        return {"kind": "null"}, np.full(len(values), np.nan)
+    if all(isinstance(_value, bool) for _value in present):
+        array = np.array(
+            [-1 if _value is None else int(_value) for _value in values],
+            dtype=np.int8,
+        )
+        return {"kind": "bool"}, array
+    if all(_is_number(_value) for _value in present):
+        integer = all(isinstance(_value, int) for _value in present)
+        if integer and complete:
+            return {"kind": "int"}, np.array(values, dtype=np.int64)
+        array = np.array(
+            [np.nan if _value is None else _value for _value in values],
+            dtype=np.float64,
+        )
+        return {"kind": "float", "integer": integer}, array
+    if all(isinstance(_value, str) for _value in present):
+        return {"kind": "str"}, np.array(
+            ["" if _value is None else _value for _value in values]
+        )
+    if all(
+        isinstance(_value, list) and all(_is_number(_x) for _x in _value)
+        for _value in present
+    ):
+        widths = {len(_value) for _value in present}
+        if len(widths) != 1 or 0 in widths:
+            return None, None
+        width = widths.pop()
+        array = np.full((len(values), width), np.nan)
+        for i, _value in enumerate(values):
+            if _value is not None:
+                array[i] = _value
+        integer = all(
+            isinstance(_x, int) for _value in present for _x in _value
+        )
+        return {"kind": "vector", "integer": integer}, array
+    return None, None
+
+
+def _comparable(value):
+    # NaN is not equal to itself.
+    if isinstance(value, float) and value != value:
+        return "NaN"
+    if isinstance(value, list):
+        return [_comparable(_x) for _x in value]
+    if isinstance(value, dict):
+        return {_k: _comparable(_v) for _k, _v in value.items()}
+    return value
+
+
+def write_columnar_archive(directory: Path, rows):
+    """
+    stores the rows of a dataset as one .npy file per field together with
+    a small JSON header, which maps the field names to the file names.
+    Fields with values which cannot be represented as a column are skipped
+    and listed in the header. Whether a value is missing, null or present
+    is stored for fields which are not complete. The archive is only moved
+    into place if it reproduces the rows except for the skipped fields,
+    otherwise ValueError is raised, as well as if the archive exists.
+    """
+    if directory.joinpath(HEADER_FILE).is_file():
+        raise ValueError(f"columnar archive {directory} exists")
+    field_names = {}
+    for _row in rows:
+        field_names.update(dict.fromkeys(_row))
+    header = {
+        "version": FORMAT_VERSION,
+        "rows": len(rows),
+        "fields": [],
+        "skipped": [],
+    }
+    temporary_directory = directory.with_name(f".{directory.name}.tmp")
+    if temporary_directory.exists():
+        shutil.rmtree(temporary_directory)
+    temporary_directory.mkdir(parents=True)
+    for _name in field_names:
+        column, array = _to_column([_row.get(_name) for _row in rows])
+        if column is None:
+            header["skipped"].append(_name)
+            continue
+        column["name"] = _name
+        # field names may contain any character, e.g. "/".
+        column["file"] = f"field_{len(header['fields'])}"
+        np.save(temporary_directory / f"{column['file']}.npy", array)
+        states = np.array(
+            [
+                (
+                    STATE_MISSING
+                    if _name not in _row
+                    else STATE_NULL if _row[_name] is None else STATE_VALUE
+                )
+                for _row in rows
+            ],
+            dtype=np.int8,
+        )
+        column["state"] = bool((states != STATE_VALUE).any())
+        if column["state"]:
+            np.save(
+                temporary_directory / f"{column['file']}.state.npy", states
+            )
+        header["fields"].append(column)
+    (temporary_directory / HEADER_FILE).write_text(json.dumps(header))
+    skipped = set(header["skipped"])
+    expected = [
+        {_k: _v for _k, _v in _row.items() if _k not in skipped}
+        for _row in rows
+    ]
+    stored = ColumnarArchive(temporary_directory).rows()
+    if _comparable(stored) != _comparable(expected):
+        shutil.rmtree(temporary_directory)
+        raise ValueError(f"columnar archive of {directory} differs")
+    # left over without a header, e.g. by an interrupted copy.
+    if directory.is_dir():
+        shutil.rmtree(directory)
+    elif directory.exists():
+        directory.unlink()
+    temporary_directory.rename(directory)
+
+
+class ColumnarArchive:
+    """
+    read access to a dataset written by write_columnar_archive. Columns are
+    memory-mapped, so only the slices which are accessed are read from
+    disk.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        header = json.loads((directory / HEADER_FILE).read_text())
+        if header["version"] not in (1, FORMAT_VERSION):
+            raise ValueError(f"unsupported format version in {directory}")
+        self.version = header["version"]
+        self.length = header["rows"]
+        self.fields = {_field["name"]: _field for _field in header["fields"]}
+        self._columns = {}
+
+    def column(self, name):
+        """
+        returns the memory-mapped column or None if the field is unknown.
+        """
+        if name not in self.fields:
+            return None
+        if name not in self._columns:
+            self._columns[name] = np.load(
+                self.directory / f"{self._file(name)}.npy", mmap_mode="r"
+            )
+        return self._columns[name]
+
+    def _file(self, name):
+        # archives written before the header contained file names.
+        return self.fields[name].get("file", name)
+
+    def bounds(self, utc_min=None, utc_max=None):
+        """
+        returns the range [start, stop) of rows within the utc limits.
+        """
+        utc = self.column("utc")
+        start = 0 if utc_min is None else np.searchsorted(utc, utc_min, "left")
+        stop = (
+            self.length
+            if utc_max is None
+            else np.searchsorted(utc, utc_max, "right")
+        )
+        return int(start), int(max(start, stop))
+
+    def _decode(self, field, values):
+        """
+        decodes the values of a column. Placeholders of version 1 are
+        returned as None.
+        """
+        kind = field["kind"]
+        # the placeholders of later versions are masked by the states.
+        masked = self.version > 1
+        if kind == "null":
+            return [None] * len(values)
+        if kind == "bool":
+            return [
+                None if _x < 0 and not masked else bool(_x) for _x in values
+            ]
+        if kind == "str":
+            return values if masked else [_x if _x else None for _x in values]
+        if kind == "float":
+            cast = int if field["integer"] else float
+            # NaN values are kept unless they are placeholders.
+            placeholder = not masked or field["integer"]
+            return [
+                None if _x != _x and placeholder else cast(_x) for _x in values
+            ]
+        if kind == "vector":
+            if field["integer"]:
+                return [
+                    None if _x[0] != _x[0] else [int(_y) for _y in _x]
+                    for _x in values
+                ]
+            if masked:
+                return values
+            return [None if _x[0] != _x[0] else _x for _x in values]
+        return values
+
+    def _values(self, name, start, stop):
+        """
+        returns the values of a field with _MISSING for omitted values.
+        """
+        field = self.fields[name]
+        values = self._decode(field, self.column(name)[start:stop].tolist())
+        if self.version == 1:
+            return [_MISSING if _x is None else _x for _x in values]
+        if not field["state"]:
+            return values
+        states = np.load(
+            self.directory / f"{self._file(name)}.state.npy", mmap_mode="r"
+        )[start:stop].tolist()
+        return [
+            (
+                _x
+                if _state == STATE_VALUE
+                else None if _state == STATE_NULL else _MISSING
+            )
+            for _x, _state in zip(values, states)
+        ]
+
+    def rows(self, start=0, stop=None):
+        """
+        returns the rows [start, stop) as list of dicts. Missing values are
+        omitted as in the original rows.
+        """
+        if stop is None:
+            stop = self.length
+        rows = [{} for _ in range(max(0, stop - start))]
+        for _name in self.fields:
+            for _row, _value in zip(rows, self._values(_name, start, stop)):
+                if _value is not _MISSING:
+                    _row[_name] = _value
+        return rows
+
+
+def get_columnar_archive(_id):
+    """
+    returns the columnar archive of a dataset or None if not available.
+    """
+    directory = columnar_directory.joinpath(_id)
+    if not directory.joinpath(HEADER_FILE).is_file():
+        return None
+    return ColumnarArchive(directory)
+
+
+if __name__ == "__main__":
+    # convert existing JSON archives given as arguments.
+    for _file_name in sys.argv[1:]:
+        _path = Path(_file_name)
+        _directory = columnar_directory.joinpath(_path.stem)
+        if _directory.exists():
+            print(f"{_directory} exists, skipping.")
+            continue
+        with _path.open() as f:
+            try:
+                write_columnar_archive(_directory, json.load(f))
+            except ValueError as e:
+                print(e)
+                continue
+        print(f"{_path} -> {_directory}")
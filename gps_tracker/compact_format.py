@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+import math
+import random
+import struct
+import zlib
+import orjson
+
+# Compact upload format of a batch of rows:
+#   MAGIC, version byte, zlib compressed payload.
+# The payload contains the row count as varint, then for each of the
+# DELTA_FIELDS a presence bitmap of the rows (LSB first) followed by the
+# differences of the present values in fixed point as zigzag varints. The
+# first difference is taken from zero. All other fields of the rows follow
+# as JSON array of objects. Values of DELTA_FIELDS which are not numbers,
+# e.g. null, are kept in the JSON part. Their numbers are decoded as floats,
+# so integers like a utc or alt of 0 come back as 0.0.
+MAGIC = b"GTC"
+VERSION = 1
+# fields with the number of decimals of their fixed point representation.
+DELTA_FIELDS = (
+    ("utc", 3),
+    ("lat", 7),
+    ("lon", 7),
+    ("alt", 2),
+    ("speed", 2),
+    ("pressure", 1),
+)
+
+
+def _is_number(value):
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def _write_varint(buffer, value):
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def encode_batch(rows):
+    """returns the compact encoding of a list of dicts as bytes."""
+    count = len(rows)
+    rest = [dict(_row) for _row in rows]
+    payload = bytearray()
+    _write_varint(payload, count)
+    for _name, _decimals in DELTA_FIELDS:
+        scale = 10**_decimals
+        bitmap = bytearray((count + 7) // 8)
+        deltas = bytearray()
+        previous = 0
+        for _index, _row in enumerate(rest):
+            value = _row.get(_name)
+            if not _is_number(value):
+                continue
+            del _row[_name]
+            bitmap[_index >> 3] |= 1 << (_index & 7)
+            fixed = round(value * scale)
+            _write_varint(deltas, _zigzag(fixed - previous))
+            previous = fixed
+        payload += bitmap
+        payload += deltas
+    payload += orjson.dumps(rest)
+    return MAGIC + bytes([VERSION]) + zlib.compress(payload, 9)
+
+
+def decode_batch(blob):
+    """
+    reference decoder returning the list of dicts of a compact encoding.
+    Values of DELTA_FIELDS are rounded to their number of decimals. Raises
+    ValueError for blobs which are truncated or corrupt.
+    """
+    if len(blob) <= len(MAGIC) or blob[: len(MAGIC)] != MAGIC:
+        raise ValueError("not a compact batch")
+    if blob[len(MAGIC)] != VERSION:
+        raise ValueError(f"unsupported version {blob[len(MAGIC)]}")
+    try:
+        payload = zlib.decompress(blob[len(MAGIC) + 1 :])
+    except zlib.error as e:
+        raise ValueError(f"corrupt payload: {e}") from e
+    count, offset = _read_varint(payload, 0)
+    # each row takes at least the two bytes of "{}" in the JSON part.
+    if 2 * count > len(payload):
+        raise ValueError("row count exceeds the payload")
+    columns = []
+    for _name, _decimals in DELTA_FIELDS:
+        bitmap = payload[offset : offset + (count + 7) // 8]
+        if len(bitmap) != (count + 7) // 8:
+            raise ValueError("truncated payload")
+        offset += len(bitmap)
+        values = [None] * count
+        fixed = 0
+        for _index in range(count):
+            if not bitmap[_index >> 3] & 1 << (_index & 7):
+                continue
+            delta, offset = _read_varint(payload, offset)
+            fixed += _unzigzag(delta)
+            values[_index] = round(fixed / 10**_decimals, _decimals)
+        columns.append((_name, values))
+    try:
+        rows = orjson.loads(payload[offset:])
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"corrupt rows: {e}") from e
+    if not isinstance(rows, list) or not all(
+        isinstance(_row, dict) for _row in rows
+    ):
+        raise ValueError("rows are not a list of objects")
+    if len(rows) != count:
+        raise ValueError("inconsistent row count")
+    for _name, _values in columns:
+        for _row, _value in zip(rows, _values):
+            if _value is not None:
+                _row[_name] = _value
+    return rows
+
+
+def _expected(row):
+    """returns the row as it is expected after a round trip."""
+    expected = dict(row)
+    for _name, _decimals in DELTA_FIELDS:
+        value = expected.get(_name)
+        if _is_number(value):
+            expected[_name] = round(
+                round(value * 10**_decimals) / 10**_decimals, _decimals
+            )
+    return expected
+
+
+def _simulate_rows(count, seed=0):
+    rng = random.Random(seed)
+    utc, lat, lon, alt = 1.7e9, 52.5, 13.4, 40.0
+    rows = []
+    for _ in range(count):
+        utc += rng.choice((0.5, 1.0, 2.0, 37.25))
+        lat += rng.gauss(0, 1e-4)
+        lon += rng.gauss(0, 1e-4)
+        alt += rng.gauss(0, 0.5)
+        row = {
+            "utc": utc,
+            "lat": lat,
+            "lon": lon,
+            "alt": round(alt, 3),
+            "speed": round(abs(rng.gauss(1.5, 1.0)), 3),
+            "pressure": round(rng.gauss(100500, 30), 3),
+            "temperature": round(rng.gauss(20, 1), 2),
+            "hdop": round(rng.uniform(0.6, 2.5), 2),
+            "hostname": "gpstracker",
+            "sensor": "gps",
+            "my_status": rng.choice((0, 1, 2, 3, 4)),
+            "localtime": "2024-05-01 12:00:00",
+        }
+        rows.append(row)
+    return rows
+
+
+def _self_check():
+    """round trip checks of the encoding, see __main__."""
+    cases = {
+        "empty batch": [],
+        "single row": _simulate_rows(1),
+        "track": _simulate_rows(500),
+        "missing and null values": [
+            {"utc": 1.0, "lat": 0.0, "lon": None, "hostname": "a"},
+            {"utc": 2.5, "pressure": 99999.95, "hostname": "b"},
+            {"lat": -89.9999999, "lon": -179.9999999, "speed": None},
+            {"utc": float("nan"), "alt": -420.5, "tag": [1, 2]},
+            {},
+        ],
+        "integer values and large jumps": [
+            {"utc": 0, "lat": 90, "lon": 180, "alt": 9000, "pressure": 0},
+            {"utc": 4102444800, "lat": -90, "lon": -180, "alt": -11000},
+            {"utc": 1, "pressure": 120000, "speed": 0},
+        ],
+    }
+    for _name, _rows in cases.items():
+        decoded = decode_batch(encode_batch(_rows))
+        expected = [_expected(_row) for _row in _rows]
+        # NaN is not equal to itself but survives in the JSON part as null.
+        expected = orjson.loads(orjson.dumps(expected))
+        assert decoded == expected, _name
+        print(f"{_name}: {len(_rows)} rows ok")
+    blob = encode_batch(_simulate_rows(20))
+    truncated_payload = zlib.compress(zlib.decompress(blob[4:])[:-30])
+    for _blob, _error in (
+        (b"XYZ\x01", "not a compact batch"),
+        (MAGIC, "not a compact batch"),
+        (MAGIC + b"\x02", "unsupported version"),
+        (blob[:-10], "corrupt payload"),
+        (blob[:4] + truncated_payload, "corrupt rows"),
+        (blob[:4] + zlib.compress(b"\x00{}"), "rows are not a list"),
+        (blob[:4] + zlib.compress(b"\x85"), "truncated varint"),
+        (blob[:4] + zlib.compress(b"\x05\x1f[{}]"), "row count exceeds"),
+    ):
+        try:
+            decode_batch(_blob)
+        except ValueError as e:
+            assert str(e).startswith(_error), (_error, e)
+        else:
+            raise AssertionError(_error)
+    # corrupt blobs must not raise anything but ValueError.
+    rng = random.Random(0)
+    for _ in range(2000):
+        payload = bytearray(zlib.decompress(blob[4:]))
+        payload[rng.randrange(len(payload))] = rng.randrange(256)
+        try:
+            decode_batch(blob[:4] + zlib.compress(bytes(payload)))
+        except ValueError:
+            pass
+    print("truncated and corrupt batches ok")
+    rows = _simulate_rows(100)
+    lines = sum(len(orjson.dumps(_row)) for _row in rows)
+    compact = len(encode_batch(rows))
+    print(
+        f"100 rows: {lines} bytes as JSON lines, {compact} bytes compact "
+        f"({lines / compact:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,75 @@
+import os
+import threading
+import logging
+from pathlib import Path
+
+THERMAL_ZONE = Path("/sys/class/thermal/thermal_zone0/temp")
+# provided by the firmware driver of the Raspberry Pi kernel.
+THROTTLED_FILE = Path("/sys/devices/platform/soc/soc:firmware/get_throttled")
+SAMPLE_INTERVAL = 10.0
+
+
+def read_cpu_temperature():
+    """returns the CPU temperature in degree Celsius or None."""
+    try:
+        return int(THERMAL_ZONE.read_text()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+def read_throttled():
+    """
+    returns the throttling flags as reported by "vcgencmd get_throttled" or
+    None if not available.
+    """
+    try:
+        return int(THROTTLED_FILE.read_text(), 16)
+    except (OSError, ValueError):
+        return None
+
+
+class CpuMonitor:
+    """
+    samples the CPU temperature in a background thread at a low rate.
+    Throttling state and load average are added to the data if extended is
+    set.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, extended=False):
+        self.interval = interval
+        self.extended = extended
+        self._data = {"rpi_temperature": None}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def sample(self):
+        temperature = read_cpu_temperature()
+        data = {
+            "rpi_temperature": (
+                round(temperature, 1) if temperature is not None else None
+            )
+        }
+        if self.extended:
+            data["rpi_throttled"] = read_throttled()
+            data["rpi_load"] = round(os.getloadavg()[0], 2)
+        # replaced as a whole to be read consistently by other threads.
+        self._data = data
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                logging.exception("sampling CPU data failed")
+
+    def get_data(self):
+        """returns the latest sampled values without blocking."""
+        return self._data
@@ -3,6 +3,33 @@ import numpy as np
 import math
 
 
+def _sector_means(data, sector_ids, valid, n_sectors):
+    """
+    returns the mean of the points of each non-empty sector ordered by the
+    sector index.
+    """
+    sector_ids = sector_ids[valid]
+    points = data[valid]
+    counts = np.bincount(sector_ids, minlength=n_sectors)
+    occupied = counts > 0
+    sums = np.array(
+        [
+            np.bincount(sector_ids, weights=points[:, k], minlength=n_sectors)
+            for k in range(3)
+        ]
+    ).T
+    return sums[occupied] / counts[occupied, np.newaxis]
+
+
+def _bin_index(values, edges):
+    """
+    returns the index i of the bin with edges[i] <= value < edges[i + 1]
+    and whether the value is inside of any bin.
+    """
+    index = np.searchsorted(edges, values, side="right") - 1
+    return index, (index >= 0) & (index < len(edges) - 1)
+
+
 def data_regularize(data, type="spherical", divs=10):
     limits = np.array(
         [
@@ -20,24 +47,13 @@ def data_regularize(data, type="spherical", divs=10):
         Y = np.linspace(*limits[1], num=divs)
         Z = np.linspace(*limits[2], num=divs)
 
-        for i in range(divs - 1):
-            for j in range(divs - 1):
-                for k in range(divs - 1):
-                    points_in_sector = []
-                    for point in data:
-                        if (
-                            point[0] >= X[i]
-                            and point[0] < X[i + 1]
-                            and point[1] >= Y[j]
-                            and point[1] < Y[j + 1]
-                            and point[2] >= Z[k]
-                            and point[2] < Z[k + 1]
-                        ):
-                            points_in_sector.append(point)
-                    if len(points_in_sector) > 0:
-                        regularized.append(
-                            np.mean(np.array(points_in_sector), axis=0)
-                        )
+        i, valid_i = _bin_index(data[:, 0], X)
+        j, valid_j = _bin_index(data[:, 1], Y)
+        k, valid_k = _bin_index(data[:, 2], Z)
+        sector_ids = (i * (divs - 1) + j) * (divs - 1) + k
+        regularized = _sector_means(
+            data, sector_ids, valid_i & valid_j & valid_k, (divs - 1) ** 3
+        )
 
     elif type == "spherical":  # take mean from points in the sector
         divs_u = divs
@@ -61,32 +77,17 @@ def data_regularize(data, type="spherical", divs=10):
         u = np.linspace(0, np.pi, num=divs_u)
         v = np.linspace(-np.pi, np.pi, num=divs_v)
 
-        for i in range(divs_u - 1):
-            for j in range(divs_v - 1):
-                points_in_sector = []
-                for k, point in enumerate(d_s):
-                    if (
-                        point[1] >= u[i]
-                        and point[1] < u[i + 1]
-                        and point[2] >= v[j]
-                        and point[2] < v[j + 1]
-                    ):
-                        points_in_sector.append(data[k])
-
-                if len(points_in_sector) > 0:
-                    regularized.append(
-                        np.mean(np.array(points_in_sector), axis=0)
-                    )
+        i, valid_i = _bin_index(d_s[:, 1], u)
+        j, valid_j = _bin_index(d_s[:, 2], v)
+        sector_ids = i * (divs_v - 1) + j
+        regularized = _sector_means(
+            data, sector_ids, valid_i & valid_j, (divs_u - 1) * (divs_v - 1)
+        )
     return np.array(regularized)
 
 
-# http://www.mathworks.com/matlabcentral/fileexchange/24693-ellipsoid-fit
-# for arbitrary axes
-def ellipsoid_fit(X):
-    x = X[:, 0]
-    y = X[:, 1]
-    z = X[:, 2]
-    D = np.array(
+def _design_matrix(x, y, z):
+    return np.array(
         [
             x * x + y * y - 2 * z * z,
             x * x + z * z - 2 * y * y,
@@ -99,8 +100,24 @@ def ellipsoid_fit(X):
             1 - 0 * x,
         ]
     )
+
+
+# http://www.mathworks.com/matlabcentral/fileexchange/24693-ellipsoid-fit
+# for arbitrary axes
+def ellipsoid_fit(X):
+    x = X[:, 0]
+    y = X[:, 1]
+    z = X[:, 2]
+    D = _design_matrix(x, y, z)
     d2 = np.array(x * x + y * y + z * z).T  # rhs for LLSQ
-    u = np.linalg.solve(D.dot(D.T), D.dot(d2))
+    return ellipsoid_from_normal_equations(D.dot(D.T), D.dot(d2))
+
+
+def ellipsoid_from_normal_equations(DDT, Dd2):
+    """
+    solves the ellipsoid fit given the sums D.dot(D.T) and D.dot(d2).
+    """
+    u = np.linalg.solve(DDT, Dd2)
     a = np.array([u[0] + 1 * u[1] - 1])
     b = np.array([u[0] - 2 * u[1] - 1])
     c = np.array([u[1] - 2 * u[0] - 1])
@@ -128,3 +145,70 @@ def ellipsoid_fit(X):
     radii *= np.sign(evals)
 
     return center, evecs, radii, v
+
+
+def sphere_transform(evecs, radii):
+    """
+    returns the affine transformation from the ellipsoid to a sphere with
+    the same volume (translation excluded).
+    """
+    a, b, c = radii
+    r = (a * b * c) ** (1.0 / 3.0)
+    D = np.array([[r / a, 0.0, 0.0], [0.0, r / b, 0.0], [0.0, 0.0, r / c]])
+    # http://www.cs.brandeis.edu/~cs155/Lecture_07_6.pdf
+    return evecs.dot(D).dot(evecs.T)
+
+
+class StreamingEllipsoidFit:
+    """
+    ellipsoid fit from the running sums of the normal equations. Memory and
+    time per sample are constant. Samples closer than min_distance to the
+    previously accepted sample are skipped to reduce the weight of periods
+    without movement.
+    """
+
+    def __init__(self, min_distance=0.0):
+        self.min_distance = min_distance
+        self.reset()
+
+    def reset(self):
+        self.DDT = np.zeros((9, 9))
+        self.Dd2 = np.zeros(9)
+        self.count = 0
+        self._last_point = None
+
+    def add_sample(self, point):
+        point = np.asarray(point, dtype=float)
+        if (
+            self._last_point is not None
+            and np.linalg.norm(point - self._last_point) < self.min_distance
+        ):
+            return False
+        x, y, z = point
+        d = _design_matrix(x, y, z)
+        self.DDT += np.outer(d, d)
+        self.Dd2 += d * (x * x + y * y + z * z)
+        self.count += 1
+        self._last_point = point
+        return True
+
+    def get_calibration(self):
+        """
+        returns the current m_matrix and m_offset or None if the samples do
+        not describe an ellipsoid, yet.
+        """
+        if self.count < 9:
+            return None
+        try:
+            center, evecs, radii, v = ellipsoid_from_normal_equations(
+                self.DDT, self.Dd2
+            )
+        except np.linalg.LinAlgError:
+            return None
+        TR = sphere_transform(evecs, radii)
+        if not (np.all(np.isfinite(TR)) and np.all(np.isreal(TR))):
+            return None
+        return {
+            "m_matrix": np.real(TR).tolist(),
+            "m_offset": center.tolist(),
+        }
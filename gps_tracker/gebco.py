@@ -3,6 +3,7 @@ import os
 import json
 from pathlib import Path
 import numpy as np
+from byte_cache import ByteLRUCache, MISSING
 
 NCOLS = 86400
 NROWS = 43200
@@ -29,6 +30,16 @@ def get_lon_from_index(j):
     return round(j * CELLSIZE + XLLCENTER, 6)
 
 
+def get_indices_from_coordinates(lats, lons):
+    """
+    vectorized version of get_index_from_latitude and
+    get_index_from_longitude.
+    """
+    i = np.clip(np.rint((lats - YLLCENTER) / CELLSIZE), 0, NROWS - 1)
+    j = np.rint((lons - XLLCENTER) / CELLSIZE) % NCOLS
+    return i.astype(np.int64), j.astype(np.int64)
+
+
 class Gebco:
     attribution_url = (
         "https://www.gebco.net/data-products-gridded-bathymetry-data/"
@@ -40,15 +51,40 @@ class Gebco:
     )
     seabed_included = True
     NODATA = -32768
-    old_i = None
-    old_j = None
-    old_val = None
+    # block size used for grouping reads if the dataset is not chunked.
+    DEFAULT_BLOCK_SHAPE = (256, 256)
     h5_file = None
+    block_cache = None
 
-    def __init__(self, file_path: Path = GEBCO_PATH):
+    def __init__(self, file_path: Path = GEBCO_PATH, cache_bytes: int = 0):
         if not file_path.is_file():
             raise FileNotFoundError(file_path)
         self.h5_file = h5py.File(file_path, "r")
+        self.elevation = self.h5_file["elevation"]
+        self.block_shape = self.elevation.chunks or self.DEFAULT_BLOCK_SHAPE
+        if cache_bytes > 0:
+            # decoded blocks of the elevation grid shared by all requests.
+            self.block_cache = ByteLRUCache(cache_bytes)
+
+    def close(self):
+        if self.h5_file is not None:
+            self.h5_file.close()
+            self.h5_file = None
+
+    def _get_block(self, i0, j0):
+        """
+        returns the block of the elevation grid starting at (i0, j0).
+        """
+        if self.block_cache is not None:
+            block = self.block_cache.get((i0, j0))
+            if block is not MISSING:
+                return block
+        block_rows, block_cols = self.block_shape
+        block = self.elevation[i0 : i0 + block_rows, j0 : j0 + block_cols]
+        block.setflags(write=False)
+        if self.block_cache is not None:
+            self.block_cache.put((i0, j0), block, block.nbytes)
+        return block
 
     def get_height(self, lat, lon):
         if not (-90 <= lat <= 90 and -180 <= lon <= 180):
@@ -60,14 +96,13 @@ class Gebco:
         lon_found = get_lon_from_index(j)
         if self.h5_file is None:
             pass
-        elif self.old_i == i and self.old_j == j:
-            # same grid position, file access not necessary
-            val = self.old_val
+        elif self.block_cache is not None:
+            block_rows, block_cols = self.block_shape
+            i0 = i // block_rows * block_rows
+            j0 = j // block_cols * block_cols
+            val = round(float(self._get_block(i0, j0)[i - i0, j - j0]), 2)
         else:
-            val = round(float(self.h5_file["elevation"][i][j]), 2)
-            self.old_i = i
-            self.old_j = j
-            self.old_val = val
+            val = round(float(self.elevation[i, j]), 2)
         return {
             "lat": lat,
             "lon": lon,
@@ -79,3 +114,38 @@ class Gebco:
             "source": self.attribution_name,
             "attributions": [self.attribution],
         }
+
+    def get_heights(self, lats, lons):
+        """
+        returns the altitudes for arrays of coordinates. The grid indices are
+        grouped by HDF5 chunk, so each required chunk is read only once.
+        The altitude of non-finite or out of range coordinates is NaN.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        valid = (
+            (-90 <= lats) & (lats <= 90) & (-180 <= lons) & (lons <= 180)
+        )
+        heights = np.where(valid, float(self.NODATA), np.nan)
+        if self.h5_file is None or not valid.any():
+            return heights
+        block_rows, block_cols = self.block_shape
+        points = np.flatnonzero(valid.ravel())
+        i, j = get_indices_from_coordinates(
+            lats.ravel()[points], lons.ravel()[points]
+        )
+        block_ids = (i // block_rows) * NCOLS + j // block_cols
+        order = np.argsort(block_ids, kind="stable")
+        sorted_ids = block_ids[order]
+        starts = np.flatnonzero(np.diff(sorted_ids, prepend=-1))
+        stops = np.append(starts[1:], len(order))
+        flat_heights = heights.ravel()
+        for _start, _stop in zip(starts, stops):
+            _indices = order[_start:_stop]
+            i0 = int(i[_indices[0]] // block_rows * block_rows)
+            j0 = int(j[_indices[0]] // block_cols * block_cols)
+            block = self._get_block(i0, j0)
+            flat_heights[points[_indices]] = block[
+                i[_indices] - i0, j[_indices] - j0
+            ]
+        return np.round(heights, 2)
@@ -1,20 +1,21 @@
 #!venv/bin/python3
-import redis
-import json
+import argparse
+import asyncio
 import os
-import pygeodesy
-from collections import deque
+import time
 from time import localtime, strftime, gmtime
 from math import sin, cos, acos, radians
+import orjson
+from redis import asyncio as aioredis
+from cpu_monitor import CpuMonitor
+from utm_fast import to_utm_mgrs_strings
+from ring_buffer import TimeRingBuffer, PRESSURE_FIELDS, IMU_FIELDS
+from transport import queue_message, get_async_consumer
 
-# Initialize Redis connection and pubsub
-redis_connection = redis.Redis(decode_responses=True)
-_pubsub = redis_connection.pubsub()
-_pubsub.subscribe("gps", "barometer", "imu", "imu_barometer")
-# Initialize deques for history
-pressure_history = deque(maxlen=50)
-imu_history = deque(maxlen=50)
-imu_barometer_history = deque(maxlen=50)
+CHANNELS = ("gps", "barometer", "imu", "imu_barometer")
+CONSUMER_GROUP = "gps_baro_merge"
+# Size of the time indexed buffers for history
+HISTORY_SIZE = 50
 # Constants
 MAX_PAUSE = 30
 MAX_DIST = 8
@@ -67,15 +68,8 @@ DUMP_IGNORE_KEYS = [
     "imu_baro_vertical_speed",
     "imu_baro_altitude",
 ]
-# Global variables for tracking state
-old_location = None
-old_utc = None
-old_pressure = None
-
-
-def get_cpu_temperature():
-    res = os.popen("vcgencmd measure_temp").readline()
-    return float(res.replace("temp=", "").replace("'C\n", ""))
+# Log throttling state and load average in addition to the CPU temperature.
+LOG_CPU_STATUS = os.getenv("LOG_CPU_STATUS", "0") == "1"
 
 
 def get_distance(location1, location2):
@@ -88,82 +82,212 @@ def get_distance(location1, location2):
     return distance
 
 
-def update_data_with_history(data, history, key_prefix):
-    """Update data with the most recent entry from history."""
-    while history:
-        history_data = history.popleft()
-        if history_data[f"{key_prefix}_utc"] > data["utc"] - 0.08:
-            data.update(history_data)
-            break
+def update_data_with_history(data, history):
+    """Update data with the history interpolated to the GPS epoch."""
+    history_data = history.interpolate(data["utc"])
+    if history_data is not None:
+        data.update(history_data)
 
 
-def process_gps_data(data):
-    """Process GPS data and update Redis."""
-    global old_location, old_utc, old_pressure
+class GpsBaroMerge:
+    """
+    merges the GPS fixes with the sensor data interpolated to their epoch.
+    Fixes which differ significantly from the last stored one are published
+    on "transfer_data" and appended to the tracking log of the day in one
+    pipeline together with those of the other fixes of the same read.
+    Without a Redis connection nothing is written, which allows to replay
+    recorded messages offline.
+    """
 
-    utc = data.get("utc")
-    if utc is None:
-        print("utc is None")
-        return
+    def __init__(self, redis_connection=None, cpu_monitor=None):
+        self.redis_connection = redis_connection
+        self.cpu_monitor = cpu_monitor
+        self.pressure_history = TimeRingBuffer(
+            HISTORY_SIZE, PRESSURE_FIELDS, "p_utc"
+        )
+        self.imu_history = TimeRingBuffer(HISTORY_SIZE, IMU_FIELDS, "i_utc")
+        # the p_utc of combined messages repeats while the IMU data is updated.
+        self.imu_barometer_history = TimeRingBuffer(
+            HISTORY_SIZE, {**PRESSURE_FIELDS, **IMU_FIELDS}, "i_utc"
+        )
+        self.old_location = None
+        self.old_utc = None
+        self.old_pressure = None
+        self.stored_fixes = 0
+
+    def get_status(self, data, utc, location):
+        if self.old_location is None:
+            return 3
+        elif get_distance(self.old_location, location) > MAX_DIST:
+            return 2
+        elif utc - MAX_PAUSE > self.old_utc:
+            return 1
+        elif (
+            data.get("pressure") is not None
+            and abs(data["pressure"] - self.old_pressure) > 10
+        ):
+            return 4
+        return 0
+
+    def process_gps_data(self, data):
+        """
+        returns the transfer_data message, the tracking key and the row to
+        be stored or None if the fix is not stored.
+        """
+        utc = data.get("utc")
+        if utc is None:
+            print("utc is None")
+            return None
 
-    location = (data["lat"], data["lon"])
-    update_data_with_history(data, pressure_history, "p")
-    update_data_with_history(data, imu_history, "i")
-    update_data_with_history(data, imu_barometer_history, "p")
-
-    hdop = data.get("hdop")
-    error = hdop * H_UERE_NO_DGPS if hdop is not None else None
-
-    if old_location is None:
-        status = 3
-    elif get_distance(old_location, location) > MAX_DIST:
-        status = 2
-    elif utc - MAX_PAUSE > old_utc:
-        status = 1
-    elif (
-        data.get("pressure") is not None
-        and abs(data["pressure"] - old_pressure) > 10
-    ):
-        status = 4
-    else:
-        status = 0
-
-    if status >= STATUS_THRESHOLD:
-        old_utc = utc
-        old_location = location
-        old_pressure = data.get("pressure")
-
-        if location is not None:
-            utm = pygeodesy.toUtm(*location)
-            data["utm"] = utm.toStr()
-            data["mgrs"] = utm.toMgrs().toStr()
-
-        data["rpi_temperature"] = get_cpu_temperature()
+        location = (data["lat"], data["lon"])
+        update_data_with_history(data, self.pressure_history)
+        update_data_with_history(data, self.imu_history)
+        update_data_with_history(data, self.imu_barometer_history)
+
+        status = self.get_status(data, utc, location)
+        if status < STATUS_THRESHOLD:
+            return None
+        self.old_utc = utc
+        self.old_location = location
+        self.old_pressure = data.get("pressure")
+
+        try:
+            data["utm"], data["mgrs"] = to_utm_mgrs_strings(*location)
+        except ValueError:
+            pass
+
+        if self.cpu_monitor is not None:
+            data.update(self.cpu_monitor.get_data())
+        hdop = data.get("hdop")
         data["my_status"] = status
         data["localtime"] = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        # orjson writes NaN as null, which is what the browser can parse.
         data["pos_error"] = (
-            round(error, 2) if error is not None else float("nan")
+            round(hdop * H_UERE_NO_DGPS, 2) if hdop is not None else None
         )
+        message = orjson.dumps(data)
+        row = {
+            _key: _value
+            for _key, _value in data.items()
+            if _key not in DUMP_IGNORE_KEYS
+        }
+        key = f"tracking:{data['hostname']}:{strftime('%Y%m%d', gmtime())}"
+        self.stored_fixes += 1
+        return message, key, orjson.dumps(row)
 
-        redis_connection.publish("transfer_data", json.dumps(data))
+    def process_message(self, channel, message_data):
+        """
+        updates the histories or processes a GPS fix. Returns the output of
+        process_gps_data() for stored fixes, otherwise None.
+        """
+        data = orjson.loads(message_data)
+        if channel == "barometer" and not data.get("imu_barometer_available"):
+            self.pressure_history.append(data)
+        elif channel == "imu" and not data.get("imu_barometer_available"):
+            self.imu_history.append(data)
+        elif channel == "imu_barometer":
+            self.imu_barometer_history.append(data)
+        elif channel == "gps" and data.get("sensor") == "gps":
+            return self.process_gps_data(data)
+        return None
 
-        for key in DUMP_IGNORE_KEYS:
-            data.pop(key, None)
+    async def store(self, outputs):
+        if self.redis_connection is None or not outputs:
+            return
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        for message, key, row in outputs:
+            queue_message(pipeline, "transfer_data", message)
+            pipeline.lpush(key, row)
+        await pipeline.execute()
 
-        key = f"tracking:{data['hostname']}:{strftime('%Y%m%d', gmtime())}"
-        redis_connection.lpush(key, json.dumps(data))
-
-
-for item in _pubsub.listen():
-    if item["type"] != "message":
-        continue
-    channel = item["channel"]
-    data = json.loads(item["data"])
-    if channel == "barometer" and not data.get("imu_barometer_available"):
-        pressure_history.append(data)
-    elif channel == "imu" and not data.get("imu_barometer_available"):
-        imu_history.append(data)
-    elif channel == "imu_barometer":
-        imu_barometer_history.append(data)
-    elif channel == "gps" and data.get("sensor") == "gps":
-        process_gps_data(data)
+    async def handle_messages(self, messages):
+        """processes a list of (channel, data) and stores the results."""
+        outputs = []
+        for _channel, _data in messages:
+            output = self.process_message(_channel, _data)
+            if output is not None:
+                outputs.append(output)
+        await self.store(outputs)
+
+    async def run(self, record_file=None):
+        """
+        processes the messages of the configured transport. They are
+        acknowledged after their results are stored. Received messages are
+        appended to the record file if given.
+        """
+        consumer = get_async_consumer(
+            self.redis_connection, CHANNELS, CONSUMER_GROUP
+        )
+        while True:
+            messages = await consumer.read()
+            if record_file is not None:
+                record_file.write(
+                    b"".join(
+                        orjson.dumps(
+                            {"channel": _channel, "data": _data.decode()},
+                            option=orjson.OPT_APPEND_NEWLINE,
+                        )
+                        for _channel, _data, *_ in messages
+                    )
+                )
+            await self.handle_messages(
+                [(_message.channel, _message.data) for _message in messages]
+            )
+            await consumer.ack(messages)
+
+    async def replay(self, file_name):
+        """
+        processes the messages of a file recorded by run() as fast as
+        possible and returns their count.
+        """
+        count = 0
+        with open(file_name, "rb") as replay_file:
+            for _line in replay_file:
+                item = orjson.loads(_line)
+                await self.handle_messages([(item["channel"], item["data"])])
+                count += 1
+        return count
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Merge GPS and barometric data with additional information."
+        )
+    )
+    parser.add_argument(
+        "--record", help="append the received messages to this file"
+    )
+    parser.add_argument(
+        "--replay", help="process recorded messages instead of subscribing"
+    )
+    parser.add_argument(
+        "--write",
+        action="store_true",
+        help="store the results of a replay in Redis",
+    )
+    args = parser.parse_args()
+    cpu_monitor = CpuMonitor(extended=LOG_CPU_STATUS)
+    cpu_monitor.start()
+    if args.replay is not None:
+        redis_connection = aioredis.Redis() if args.write else None
+        merge = GpsBaroMerge(redis_connection, cpu_monitor)
+        t_start = time.perf_counter()
+        count = await merge.replay(args.replay)
+        duration = time.perf_counter() - t_start
+        print(
+            f"{count} messages in {duration:.3f}s "
+            f"({duration / max(count, 1) * 1e6:.1f}us/message), "
+            f"{merge.stored_fixes} fixes stored"
+        )
+        return
+    merge = GpsBaroMerge(aioredis.Redis(), cpu_monitor)
+    if args.record is None:
+        await merge.run()
+        return
+    with open(args.record, "ab", buffering=0) as record_file:
+        await merge.run(record_file)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -12,6 +12,7 @@ import orjson
 from redis import asyncio as aioredis
 
 import gps.aiogps
+from transport import publish_message_async
 
 
 def fixed_baudrate_set():
@@ -76,7 +77,9 @@ async def consume_gpsd():
                     data.pop(_key, None)
                 if data["mode"] > 1:
                     data["sensor"] = "gps"
-                    await redis_connection.publish("gps", orjson.dumps(data))
+                    await publish_message_async(
+                        redis_connection, "gps", orjson.dumps(data)
+                    )
                 if devices and old_utc:
                     _driver = devices[0].get("driver")
                     _path = devices[0].get("path")
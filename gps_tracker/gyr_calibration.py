@@ -28,6 +28,7 @@ def calibrate(measuring_duration=5):
     redis_connection.set("g_offset", json.dumps(g_offset))
     redis_connection.set("g_temp", g_temp)
     redis_connection.set("calibration_updated", 1)
+    redis_connection.publish("calibration_updated", 1)
     calibration = {
         "timestamp": t_start,
         "g_offset": g_offset,
@@ -4,6 +4,7 @@ import json
 import redis
 from lsm_poller import get_lsm_sensor
 from barometer_poller import get_barometer_sensor
+from transport import queue_message
 
 
 def main():
@@ -23,11 +24,13 @@ def main():
         sensor_data = sensor.get_sensor_data(sensor_fusion=False)
         imu_data["imu_barometer_available"] = True
         baro_data["imu_barometer_available"] = True
-        redis_connection.publish("imu", json.dumps(imu_data))
-        redis_connection.publish("barometer", json.dumps(baro_data))
+        pipeline = redis_connection.pipeline(transaction=False)
+        queue_message(pipeline, "imu", json.dumps(imu_data))
+        queue_message(pipeline, "barometer", json.dumps(baro_data))
         imu_data.update(baro_data)
         del imu_data["imu_barometer_available"]
-        redis_connection.publish("imu_barometer", json.dumps(imu_data))
+        queue_message(pipeline, "imu_barometer", json.dumps(imu_data))
+        pipeline.execute()
         dt = time.time() - t_start
         time.sleep(max(0, interval - dt))
 
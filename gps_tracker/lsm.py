@@ -2,14 +2,23 @@
 import time
 import json
 import socket
+import logging
 import redis
 import numpy as np
 import imufusion
 
+# calibration writers set this key to 1 and publish on the channel of the
+# same name. The keyspace event covers writers which only set the key if
+# keyspace notifications are enabled on the Redis server.
+CALIBRATION_CHANNEL = "calibration_updated"
+CALIBRATION_KEYSPACE_CHANNEL = f"__keyspace@0__:{CALIBRATION_CHANNEL}"
+RESUBSCRIBE_DELAY = 1.0
+
 
 class Lsm:
-    def __init__(self, config_path=None):
+    def __init__(self, config_path=None, bus=None):
         self.hostname = socket.gethostname()
+        self.bus = bus
         self.redis_connection = redis.Redis(decode_responses=True)
         self.GYR_ADDRESS = None
         self.MAG_ADDRESS = None
@@ -29,52 +38,125 @@ class Lsm:
             "rotation": [[0, -1, 0], [1, 0, 0], [0, 0, 1]],
         }
         self.use_ellipsoid_correction = False
+        self._operators = None
+        self._calibration_outdated = False
+        self._pubsub = None
+        self._pubsub_thread = None
+
+    def start_calibration_updates(self):
+        """
+        subscribes to calibration updates and loads the calibration. Called
+        by the subclasses once the sensor was found, so that failed probes
+        do not leave a subscription and its thread behind.
+        """
+        # subscribe before loading to not miss an update in between.
+        self._pubsub = self.redis_connection.pubsub(
+            ignore_subscribe_messages=True
+        )
+        self._pubsub.subscribe(
+            **{
+                CALIBRATION_CHANNEL: self._on_calibration_message,
+                CALIBRATION_KEYSPACE_CHANNEL: self._on_calibration_key_event,
+            }
+        )
+        self._pubsub_thread = self._pubsub.run_in_thread(
+            sleep_time=1,
+            daemon=True,
+            exception_handler=self._on_pubsub_error,
+        )
         self.load_calibration()
 
+    def _on_calibration_message(self, message):
+        self._calibration_outdated = True
+
+    def _on_calibration_key_event(self, message):
+        # also triggered when load_calibration resets the key.
+        if self.redis_connection.get(CALIBRATION_CHANNEL) == "1":
+            self._calibration_outdated = True
+
+    def _on_pubsub_error(self, exception, pubsub, thread):
+        logging.error(f"calibration subscription failed: {exception}")
+        time.sleep(RESUBSCRIBE_DELAY)
+        # updates may have been missed while disconnected.
+        self._calibration_outdated = True
+
     def load_calibration(self):
+        self._calibration_outdated = False
         for _key in self.calibration.keys():
             _value = self.redis_connection.get(_key)
             if _value is None:
                 continue
             self.calibration[_key] = json.loads(_value)
-        self.redis_connection.set("calibration_updated", 0)
+        self.redis_connection.set(CALIBRATION_CHANNEL, 0)
+        self._operators = None
 
     def check_calibration(self):
-        if self.redis_connection.get("calibration_updated") == "1":
+        if self._calibration_outdated:
             self.load_calibration()
 
+    def _compile_calibration(self):
+        """
+        fuses offset, rotation, ellipsoid correction and scaling of each
+        sensor into an offset vector and a matrix. This is done on first use
+        as the scales are set by the sensor specific subclass.
+        """
+        calibration = self.calibration
+        rotation = np.array(calibration["rotation"], dtype=float)
+        if self.use_ellipsoid_correction:
+            mag_matrix = rotation.dot(calibration["m_matrix"])
+        else:
+            mag_matrix = rotation
+        operators = {
+            "acc": (
+                np.array(calibration["a_offset"], dtype=float),
+                rotation * self.ACCEL_SCALE * calibration["g"],
+            ),
+            "mag": (
+                np.array(calibration["m_offset"], dtype=float),
+                mag_matrix * self.MAG_SCALE,
+            ),
+        }
+        if self.GYR_ADDRESS is not None:
+            operators["gyr"] = (
+                np.array(calibration["g_offset"], dtype=float),
+                rotation * self.GYR_SCALE,
+            )
+        self._operators = operators
+        self._operators_ellipsoid_correction = self.use_ellipsoid_correction
+
+    def get_operator(self, name):
+        """
+        returns offset and matrix transforming raw data of the sensor
+        ("acc", "mag" or "gyr") by matrix.dot(raw - offset).
+        """
+        if (
+            self._operators is None
+            or self._operators_ellipsoid_correction
+            != self.use_ellipsoid_correction
+        ):
+            self._compile_calibration()
+        return self._operators[name]
+
+    def _apply_calibration(self, name, raw):
+        offset, matrix = self.get_operator(name)
+        return matrix.dot(np.subtract(raw, offset))
+
     def get_acceleration(self):
         """returns acceleration as [x, y, z] in units of m/s^2."""
         self.update_raw_acceleration()
-        data = np.array(self.raw_acceleration)
-        calibration = self.calibration
-        scaling = self.ACCEL_SCALE * self.calibration["g"]
-        centered = data - calibration["a_offset"]
-        rotated = np.array(self.calibration["rotation"]).dot(centered)
-        return rotated * scaling
+        return self._apply_calibration("acc", self.raw_acceleration)
 
     def get_magnetometer(self):
         """returns magnetic flux density as [x, y, z] in units of mT."""
         self.update_raw_magnetometer()
-        data = np.array(self.raw_magnetometer)
-        calibration = self.calibration
-        scaling = self.MAG_SCALE
-        centered = data - calibration["m_offset"]
-        if self.use_ellipsoid_correction:
-            corrected = np.array(self.calibration["m_matrix"]).dot(centered)
-        else:
-            corrected = centered
-        rotated = np.array(self.calibration["rotation"]).dot(corrected)
-        return rotated * scaling
+        return self._apply_calibration("mag", self.raw_magnetometer)
 
     def get_gyro_deg(self):
         """returns angular velocity as [x, y, z] in units of deg/s."""
         self.update_raw_gyro()
-        data = np.array(self.raw_gyro)
-        calibration = self.calibration
-        corrected = data - calibration["g_offset"]
-        rotated = np.array(self.calibration["rotation"]).dot(corrected)
-        return self.gyro_offset.update(rotated * self.GYR_SCALE)
+        return self.gyro_offset.update(
+            self._apply_calibration("gyr", self.raw_gyro)
+        )
 
     def get_gyro(self):
         """returns angular velocity as [x, y, z] in units of rad/s."""
@@ -28,8 +28,8 @@ class DeviceNotFound(IOError):
 
 
 class Lsm303d(Lsm):
-    def __init__(self, config_path=None):
-        super().__init__(config_path)
+    def __init__(self, config_path=None, bus=None):
+        super().__init__(config_path, bus)
         self.sensor = "LSM303D"
         self.ACCEL_SCALE = ACCEL_SCALE
         self.MAG_SCALE = MAG_SCALE
@@ -41,10 +41,12 @@ class Lsm303d(Lsm):
         self.initialize_sensor()
         # ensure that the sensor is really initialized to avoid false data
         self.initialize_sensor()
+        self.start_calibration_updates()
 
     def initialize_sensor(self):
-        # Get I2C bus
-        self.bus = smbus2.SMBus(1)
+        # Get I2C bus unless a shared one was given
+        if self.bus is None:
+            self.bus = smbus2.SMBus(1)
         whoami = self.bus.read_byte_data(self.ACC_ADDRESS, WHO_AM_I)
         if whoami == 0x49:
             self.bus.write_byte_data(self.ACC_ADDRESS, CTRL_REG1, 0x57)
@@ -2,6 +2,8 @@
 import smbus2
 import time
 import struct
+import numpy as np
+import imufusion
 from lsm import Lsm
 
 ACC_ADDRESS = 0x6A
@@ -22,6 +24,20 @@ CTRL_3_C = 0x12
 CTRL_6_C = 0x15
 CTRL_7_G = 0x16
 CTRL_8_XL = 0x17
+FIFO_CTRL3 = 0x08
+FIFO_CTRL5 = 0x0A
+FIFO_STATUS1 = 0x3A
+FIFO_DATA_OUT_L = 0x3E
+# gyro and accelerometer in the FIFO without decimation
+FIFO_CTRL3_VALUE = 0b00_001_001
+# FIFO at 416Hz in continuous mode
+FIFO_CTRL5_VALUE = 0b0_0110_110
+FIFO_BYPASS = 0b0_0000_000
+FIFO_RATE = 416
+# each FIFO sample consists of the gyro and accelerometer x, y, z words.
+FIFO_PATTERN_LENGTH = 6
+# the FIFO holds 2048 words of 16 bits.
+FIFO_SIZE = 2048
 CTRL_REG1_M = 0x20
 CTRL_REG2_M = 0x21
 CTRL_REG3_M = 0x22
@@ -36,9 +52,11 @@ class DeviceNotFound(IOError):
 
 
 class Lsm6dsl_Lis3mdl(Lsm):
-    def __init__(self, config_path=None):
-        super().__init__(config_path)
+    def __init__(self, config_path=None, bus=None, fifo=False):
+        super().__init__(config_path, bus)
         self.sensor = "LSM6DSL+LIS3MDL"
+        self.fifo = fifo
+        self.fifo_gyro_offset = imufusion.Offset(FIFO_RATE)
         self.ACCEL_SCALE = ACCEL_SCALE
         self.GYR_SCALE = GYR_SCALE
         self.MAG_SCALE = MAG_SCALE
@@ -53,10 +71,12 @@ class Lsm6dsl_Lis3mdl(Lsm):
         self.initialize_sensor()
         # ensure that the sensor is really initialized to avoid false data
         self.initialize_sensor()
+        self.start_calibration_updates()
 
     def initialize_sensor(self):
-        # Get I2C bus
-        self.bus = smbus2.SMBus(1)
+        # Get I2C bus unless a shared one was given
+        if self.bus is None:
+            self.bus = smbus2.SMBus(1)
         whoami_gyr = self.bus.read_byte_data(self.GYR_ADDRESS, WHO_AM_I)
         if whoami_gyr != 0x6A:
             raise DeviceNotFound("LSM6DSL not found")
@@ -75,6 +95,20 @@ class Lsm6dsl_Lis3mdl(Lsm):
         self.bus.write_byte_data(self.GYR_ADDRESS, CTRL_7_G, 0b1_0_00_0_0_0_0)
         # default values
         self.bus.write_byte_data(self.ACC_ADDRESS, CTRL_8_XL, 0b00000000)
+        if self.fifo:
+            # accelerometer and gyro: 416Hz data rate, same full scale
+            self.bus.write_byte_data(
+                self.ACC_ADDRESS, CTRL_1_XL, 0b0110_11_0_0
+            )
+            self.bus.write_byte_data(self.GYR_ADDRESS, CTRL_2_G, 0b0110_11_0_0)
+            self.bus.write_byte_data(
+                self.GYR_ADDRESS, FIFO_CTRL3, FIFO_CTRL3_VALUE
+            )
+            # switching to bypass mode clears the FIFO
+            self.bus.write_byte_data(self.GYR_ADDRESS, FIFO_CTRL5, FIFO_BYPASS)
+            self.bus.write_byte_data(
+                self.GYR_ADDRESS, FIFO_CTRL5, FIFO_CTRL5_VALUE
+            )
 
         # initialise the magnetometer
         # Temp enable, medium performance, 80Hz data rate
@@ -109,3 +143,77 @@ class Lsm6dsl_Lis3mdl(Lsm):
         raw = self.bus.read_i2c_block_data(self.MAG_ADDRESS, self.OUT_T_L_M, 2)
         self.raw_temperature = list(struct.unpack("<h", bytearray(raw)))
         return self.raw_temperature
+
+    def _read_fifo_words(self):
+        """
+        reads all complete samples from the FIFO in one I2C transaction.
+        Words which belong to a sample that was partly read before are
+        skipped to align to the start of the FIFO pattern.
+        """
+        status = self.bus.read_i2c_block_data(
+            self.GYR_ADDRESS, FIFO_STATUS1, 4
+        )
+        unread_words = status[0] + ((status[1] & 0x07) << 8)
+        pattern = status[2] + ((status[3] & 0x03) << 8)
+        skipped_words = (FIFO_PATTERN_LENGTH - pattern) % FIFO_PATTERN_LENGTH
+        samples = max(0, unread_words - skipped_words) // FIFO_PATTERN_LENGTH
+        if samples == 0:
+            return np.zeros((0, FIFO_PATTERN_LENGTH), dtype=int)
+        words = min(
+            skipped_words + samples * FIFO_PATTERN_LENGTH, FIFO_SIZE
+        )
+        write = smbus2.i2c_msg.write(self.GYR_ADDRESS, [FIFO_DATA_OUT_L])
+        read = smbus2.i2c_msg.read(self.GYR_ADDRESS, 2 * words)
+        self.bus.i2c_rdwr(write, read)
+        data = np.frombuffer(bytes(read), dtype="<i2")[skipped_words:]
+        samples = len(data) // FIFO_PATTERN_LENGTH
+        return data[: samples * FIFO_PATTERN_LENGTH].reshape(
+            samples, FIFO_PATTERN_LENGTH
+        )
+
+    def get_fifo_data(self):
+        """
+        drains the FIFO. Returns the batch of samples and the latest sample
+        in the format of get_sensor_data or (None, None) if the FIFO holds
+        no complete sample. The magnetometer and the temperature are read
+        once per batch.
+        """
+        timestamp = time.time()
+        words = self._read_fifo_words()
+        if len(words) == 0:
+            return None, None
+        self.check_calibration()
+        raw_gyro = words[:, :3]
+        raw_acceleration = words[:, 3:]
+        offset, matrix = self.get_operator("gyr")
+        rotated = (raw_gyro - offset).dot(matrix.T)
+        gyro = np.deg2rad(
+            [self.fifo_gyro_offset.update(_row) for _row in rotated]
+        )
+        self.raw_gyro = raw_gyro[-1].tolist()
+        self.raw_acceleration = raw_acceleration[-1].tolist()
+        self.update_raw_magnetometer()
+        interval = 1 / FIFO_RATE
+        first_utc = timestamp - (len(words) - 1) * interval
+        batch = {
+            "i_sensor": self.sensor,
+            "i_hostname": self.hostname,
+            "i_utc": round(first_utc, 4),
+            "interval": interval,
+            "raw_acceleration": raw_acceleration.tolist(),
+            "raw_gyro": raw_gyro.tolist(),
+            "gyro": np.round(gyro, 3).tolist(),
+            "raw_magnetometer": self.raw_magnetometer,
+            "raw_gyro_temp": self.get_raw_gyro_temperature(),
+        }
+        sensor_data = {
+            "i_sensor": self.sensor,
+            "i_hostname": self.hostname,
+            "i_utc": round(timestamp, 3),
+            "raw_acceleration": self.raw_acceleration,
+            "raw_magnetometer": self.raw_magnetometer,
+            "raw_gyro": self.raw_gyro,
+            "gyro": batch["gyro"][-1],
+            "raw_gyro_temp": batch["raw_gyro_temp"],
+        }
+        return batch, sensor_data
@@ -33,8 +33,8 @@ class DeviceNotFound(IOError):
 
 
 class Lsm9ds0(Lsm):
-    def __init__(self, config_path=None):
-        super().__init__(config_path)
+    def __init__(self, config_path=None, bus=None):
+        super().__init__(config_path, bus)
         self.sensor = "LSM9DS0"
         self.ACCEL_SCALE = ACCEL_SCALE
         self.MAG_SCALE = MAG_SCALE
@@ -49,10 +49,12 @@ class Lsm9ds0(Lsm):
         self.initialize_sensor()
         # ensure that the sensor is really initialized to avoid false data
         self.initialize_sensor()
+        self.start_calibration_updates()
 
     def initialize_sensor(self):
-        # Get I2C bus
-        self.bus = smbus2.SMBus(1)
+        # Get I2C bus unless a shared one was given
+        if self.bus is None:
+            self.bus = smbus2.SMBus(1)
         whoami_mag = self.bus.read_byte_data(self.MAG_ADDRESS, WHO_AM_I)
         whoami_gyr = self.bus.read_byte_data(self.GYR_ADDRESS, WHO_AM_I)
         if whoami_mag != 0x49 or whoami_gyr != 0xD4:
@@ -5,20 +5,24 @@ import redis
 from lsm303d import Lsm303d
 from lsm9ds0 import Lsm9ds0
 from lsm6dsl_lis3mdl import Lsm6dsl_Lis3mdl
+from transport import publish_message
 
 
-def get_lsm_sensor():
-    """Attempt to initialize each IMU sensor in turn."""
+def get_lsm_sensor(bus=None, fifo=False):
+    """
+    Attempt to initialize each IMU sensor in turn. The FIFO is only
+    supported by the LSM6DSL.
+    """
     try:
-        return Lsm303d()
+        return Lsm303d(bus=bus)
     except:
         print("no LSM303d found")
     try:
-        return Lsm9ds0()
+        return Lsm9ds0(bus=bus)
     except:
         print("no LSM9DS0 found")
     try:
-        return Lsm6dsl_Lis3mdl()
+        return Lsm6dsl_Lis3mdl(bus=bus, fifo=fifo)
     except:
         print("no LSM6DSL+LIS3MDL found")
 
@@ -33,7 +37,7 @@ def main():
     while True:
         t_start = time.time()
         sensor_data = sensor.get_sensor_data(sensor_fusion=False)
-        redis_connection.publish("imu", json.dumps(sensor_data))
+        publish_message(redis_connection, "imu", json.dumps(sensor_data))
         dt = time.time() - t_start
         time.sleep(max(0, interval - dt))
 
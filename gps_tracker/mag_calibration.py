@@ -0,0 +1,56 @@
+import asyncio
+import json
+import logging
+from ellipsoid_fit import StreamingEllipsoidFit
+
+# samples closer than this distance (in raw units) to the previously used
+# sample are skipped.
+MIN_SAMPLE_DISTANCE = 20
+# number of imu messages buffered before the oldest are dropped.
+QUEUE_SIZE = 100
+
+
+class MagnetometerCalibration:
+    """
+    fits the magnetometer calibration continuously to the raw magnetometer
+    data received on the imu channel.
+    """
+
+    def __init__(self, redis_hub, channel="imu"):
+        self.redis_hub = redis_hub
+        self.channel = channel
+        self.fit = StreamingEllipsoidFit(min_distance=MIN_SAMPLE_DISTANCE)
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = self.redis_hub.subscribe(self.channel, QUEUE_SIZE)
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.redis_hub.unsubscribe(self.channel, self._queue)
+        self._task = None
+
+    async def _consume(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                raw_magnetometer = json.loads(message).get("raw_magnetometer")
+            except ValueError:
+                logging.exception("invalid imu message")
+                continue
+            if raw_magnetometer is not None:
+                self.fit.add_sample(raw_magnetometer)
+
+    def get_calibration(self):
+        calibration = self.fit.get_calibration()
+        if calibration is not None:
+            calibration["samples"] = self.fit.count
+        return calibration
+
+    def reset(self):
+        self.fit.reset()
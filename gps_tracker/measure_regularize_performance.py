@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import time
+import numpy as np
+from ellipsoid_fit import data_regularize
+
+
+def data_regularize_loops(data, type="spherical", divs=10):
+    """
+    previous implementation of data_regularize used as reference.
+    """
+    limits = np.array(
+        [
+            [min(data[:, 0]), max(data[:, 0])],
+            [min(data[:, 1]), max(data[:, 1])],
+            [min(data[:, 2]), max(data[:, 2])],
+        ]
+    )
+    regularized = []
+    if type == "cubic":
+        X = np.linspace(*limits[0], num=divs)
+        Y = np.linspace(*limits[1], num=divs)
+        Z = np.linspace(*limits[2], num=divs)
+        for i in range(divs - 1):
+            for j in range(divs - 1):
+                for k in range(divs - 1):
+                    points_in_sector = []
+                    for point in data:
+                        if (
+                            point[0] >= X[i]
+                            and point[0] < X[i + 1]
+                            and point[1] >= Y[j]
+                            and point[1] < Y[j + 1]
+                            and point[2] >= Z[k]
+                            and point[2] < Z[k + 1]
+                        ):
+                            points_in_sector.append(point)
+                    if len(points_in_sector) > 0:
+                        regularized.append(
+                            np.mean(np.array(points_in_sector), axis=0)
+                        )
+    elif type == "spherical":
+        divs_u = divs
+        divs_v = divs * 2
+        center = np.array(
+            [
+                0.5 * (limits[0, 0] + limits[0, 1]),
+                0.5 * (limits[1, 0] + limits[1, 1]),
+                0.5 * (limits[2, 0] + limits[2, 1]),
+            ]
+        )
+        d_c = data - center
+        r_s = np.sqrt(d_c[:, 0] ** 2.0 + d_c[:, 1] ** 2.0 + d_c[:, 2] ** 2.0)
+        d_s = np.array(
+            [r_s, np.arccos(d_c[:, 2] / r_s), np.arctan2(d_c[:, 1], d_c[:, 0])]
+        ).T
+        u = np.linspace(0, np.pi, num=divs_u)
+        v = np.linspace(-np.pi, np.pi, num=divs_v)
+        for i in range(divs_u - 1):
+            for j in range(divs_v - 1):
+                points_in_sector = []
+                for k, point in enumerate(d_s):
+                    if (
+                        point[1] >= u[i]
+                        and point[1] < u[i + 1]
+                        and point[2] >= v[j]
+                        and point[2] < v[j + 1]
+                    ):
+                        points_in_sector.append(data[k])
+                if len(points_in_sector) > 0:
+                    regularized.append(
+                        np.mean(np.array(points_in_sector), axis=0)
+                    )
+    return np.array(regularized)
+
+
+def simulate_magnetometer_data(n_samples, seed=0):
+    """
+    raw magnetometer readings on a shifted and distorted ellipsoid.
+    """
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(n_samples, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    distortion = np.array([[2800, 150, 0], [150, 2500, 80], [0, 80, 3100]])
+    points = directions.dot(distortion) + [400, -1200, 300]
+    points += rng.normal(scale=20, size=points.shape)
+    return np.round(points).astype(int)
+
+
+def measure_regularize_performance(n_samples=5000, divs=8, repeat=3):
+    data = simulate_magnetometer_data(n_samples)
+    for _type in ("spherical", "cubic"):
+        t_start = time.perf_counter()
+        reference = data_regularize_loops(data, type=_type, divs=divs)
+        t_loops = time.perf_counter() - t_start
+        t_start = time.perf_counter()
+        for _ in range(repeat):
+            result = data_regularize(data, type=_type, divs=divs)
+        t_vectorized = (time.perf_counter() - t_start) / repeat
+        print(
+            "{}: {} samples, {} sectors, loops {:.3f}s, vectorized {:.5f}s "
+            "({:.0f}x), identical: {}".format(
+                _type,
+                n_samples,
+                len(result),
+                t_loops,
+                t_vectorized,
+                t_loops / t_vectorized,
+                np.array_equal(reference, result),
+            )
+        )
+
+
+if __name__ == "__main__":
+    measure_regularize_performance()
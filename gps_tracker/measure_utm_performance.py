@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import time
+import numpy as np
+import pygeodesy
+from utm_fast import to_utm_mgrs_strings, to_utm_arrays
+
+
+def pygeodesy_strings(lat, lon):
+    utm = pygeodesy.toUtm(lat, lon)
+    return utm.toStr(), utm.toMgrs().toStr()
+
+
+def simulate_track(n_fixes, seed=0):
+    """
+    positions of a random walk as recorded by the tracker within one area.
+    """
+    rng = np.random.default_rng(seed)
+    lats = 52.5 + np.cumsum(rng.normal(scale=1e-4, size=n_fixes))
+    lons = 13.4 + np.cumsum(rng.normal(scale=1e-4, size=n_fixes))
+    return lats.tolist(), lons.tolist()
+
+
+def measure_utm_performance(n_fixes=2000):
+    lats, lons = simulate_track(n_fixes)
+    t_start = time.perf_counter()
+    reference = [pygeodesy_strings(*_fix) for _fix in zip(lats, lons)]
+    t_pygeodesy = (time.perf_counter() - t_start) / n_fixes
+    t_start = time.perf_counter()
+    result = [to_utm_mgrs_strings(*_fix) for _fix in zip(lats, lons)]
+    t_fast = (time.perf_counter() - t_start) / n_fixes
+    t_start = time.perf_counter()
+    to_utm_arrays(lats, lons)
+    t_arrays = (time.perf_counter() - t_start) / n_fixes
+    print(
+        "{} fixes, per fix: pygeodesy {:.1f}us, fast {:.1f}us ({:.0f}x), "
+        "arrays without formatting {:.2f}us, identical: {}".format(
+            n_fixes,
+            t_pygeodesy * 1e6,
+            t_fast * 1e6,
+            t_pygeodesy / t_fast,
+            t_arrays * 1e6,
+            reference == result,
+        )
+    )
+
+
+if __name__ == "__main__":
+    measure_utm_performance()
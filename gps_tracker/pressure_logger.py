@@ -1,15 +1,32 @@
 #!venv/bin/python3
+import asyncio
 import time
 import json
-from collections import deque
-import numpy as np
-import redis
+from redis import asyncio as aioredis
+from pressure_rollup import PressureRollup, trim
+from transport import get_async_consumer
+
+# interval and Redis key of the status showing whether the logger keeps up.
+STATUS_INTERVAL = 10
+STATUS_KEY = "pressure_logger_status"
+CHANNELS = ("barometer", "transfer_data")
+CONSUMER_GROUP = "pressure_logger"
 
 
 class PressureLogger:
+    """
+    receives the messages of the configured transport as fast as they
+    arrive and queues them for processing. All messages queued at a time
+    are processed together, their log entries are written in one pipeline
+    and then they are acknowledged.
+    """
+
     def __init__(self):
-        self.redis_connection = redis.Redis(decode_responses=True)
-        self.pressure_buffer = deque(maxlen=700)
+        self.redis_connection = aioredis.Redis(decode_responses=True)
+        # for the binary records of the rollups.
+        self.binary_connection = aioredis.Redis()
+        self.pressure_sum = 0
+        self.pressure_count = 0
         self.buffer_time = None
         self.pressure_data = None
         self.old_pressure = 0
@@ -17,8 +34,16 @@ class PressureLogger:
         self.log_altitude = True
         self.log_pressure = True
         self.log_pressure_minutes = {0, 10, 20, 30, 40, 50}
-        self._pubsub = self.redis_connection.pubsub()
-        self._pubsub.subscribe(["barometer", "transfer_data"])
+        self.consumer = get_async_consumer(
+            self.redis_connection, CHANNELS, CONSUMER_GROUP
+        )
+        self._queue = asyncio.Queue()
+        self._log_entries = []
+        self._rollups = {}
+        self._rollup_minutes = []
+        self.processed_messages = 0
+        self.max_backlog = 0
+        self.lag = None
 
     def process_transfer_data(self, data):
         if data["utc"] > self.old_pressure_utc:
@@ -26,36 +51,57 @@ class PressureLogger:
             self.old_pressure_utc = data["utc"]
 
     def log_pressure_data(self, data):
-        key = f"pressure:{data['p_hostname']}:{time.strftime('%Y%m')}"
-        self.redis_connection.lpush(key, json.dumps(data))
+        key = f"pressure:{data['hostname']}:{time.strftime('%Y%m')}"
+        self._log_entries.append((key, json.dumps(data)))
 
     def log_altitude_data(self, data):
         key = f"altitude:{data['p_hostname']}:{time.strftime('%Y%m%d')}"
-        self.redis_connection.lpush(key, json.dumps(data))
+        self._log_entries.append((key, json.dumps(data)))
 
-    def process_message(self, item):
-        if item["type"] != "message":
-            return
-        data = json.loads(item["data"])
+    def add_to_rollup(self, data):
+        # added to the rollup before writing, which may load its state.
+        self._rollup_minutes.append(
+            (
+                data["p_hostname"],
+                self.buffer_time - 60,
+                self.pressure_sum / self.pressure_count,
+                data["temperature"],
+                data.get("humidity"),
+                self.pressure_count,
+            )
+        )
+
+    async def get_rollup(self, hostname):
+        rollup = self._rollups.get(hostname)
+        if rollup is None:
+            rollup = PressureRollup(hostname)
+            await rollup.load(self.binary_connection)
+            self._rollups[hostname] = rollup
+        return rollup
+
+    def process_message(self, channel, message_data):
+        data = json.loads(message_data)
         if "pressure" not in data or "p_utc" not in data:
             return
         # The last transfer_data message represents the last data dump to Redis.
-        if item["channel"] == "transfer_data":
+        if channel == "transfer_data":
             self.process_transfer_data(data)
             return
         utc = data["p_utc"]
+        self.lag = time.time() - utc
         utc_ceil_minute = utc - utc % 60 + 60
         if self.buffer_time is None:
             self.buffer_time = utc_ceil_minute
-        elif utc_ceil_minute > self.buffer_time and self.pressure_buffer:
+        elif utc_ceil_minute > self.buffer_time and self.pressure_count:
             self.pressure_data = {
-                "pressure": int(round(np.mean(self.pressure_buffer))),
+                "pressure": int(round(self.pressure_sum / self.pressure_count)),
                 "temperature": round(data["temperature"], 1),
                 "utc": int(self.buffer_time),
                 "hostname": data["p_hostname"],
             }
             if "humidity" in data:
                 self.pressure_data["humidity"] = int(round(data["humidity"]))
+            self.add_to_rollup(data)
 
             if (
                 self.log_pressure
@@ -63,11 +109,13 @@ class PressureLogger:
                 in self.log_pressure_minutes
             ):
                 self.log_pressure_data(self.pressure_data)
-            self.pressure_buffer.clear()
+            self.pressure_sum = 0
+            self.pressure_count = 0
             self.buffer_time = utc_ceil_minute
-        elif utc_ceil_minute > self.buffer_time and not self.pressure_buffer:
+        elif utc_ceil_minute > self.buffer_time and not self.pressure_count:
             self.buffer_time = utc_ceil_minute
-        self.pressure_buffer.append(data["pressure"])
+        self.pressure_sum += data["pressure"]
+        self.pressure_count += 1
         # Add pressure values to altitude log if a significant pressure
         # difference occurs which was not considered by the tracking log.
         # Ignore small deviations from the mean value.
@@ -86,12 +134,70 @@ class PressureLogger:
                 self.old_pressure = data["pressure"]
                 self.old_pressure_utc = data["p_utc"]
 
-    def run(self):
-        for item in self._pubsub.listen():
-            self.process_message(item)
-            time.sleep(0.05)
+    async def write_log_entries(self):
+        if not self._log_entries and not self._rollup_minutes:
+            return
+        rollup_records = []
+        for _hostname, *_minute in self._rollup_minutes:
+            rollup = await self.get_rollup(_hostname)
+            rollup_records.extend(rollup.add(*_minute))
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        for key, value in self._log_entries:
+            pipeline.lpush(key, value)
+        for key, record in rollup_records:
+            pipeline.append(key, record)
+        log_entry_count = len(self._log_entries)
+        self._log_entries.clear()
+        self._rollup_minutes.clear()
+        results = await pipeline.execute()
+        # APPEND returns the new length of the string.
+        for (_key, _), _length in zip(
+            rollup_records, results[log_entry_count:]
+        ):
+            await trim(self.binary_connection, _key, _length)
+
+    def get_status(self):
+        return {
+            "backlog": self._queue.qsize(),
+            "max_backlog": self.max_backlog,
+            "lag": round(self.lag, 3) if self.lag is not None else None,
+            "processed_messages": self.processed_messages,
+            "utc": int(time.time()),
+        }
 
+    async def receive(self):
+        while True:
+            for _message in await self.consumer.read():
+                self._queue.put_nowait(_message)
+            self.max_backlog = max(self.max_backlog, self._queue.qsize())
 
-if __name__ == "__main__":
+    async def consume(self):
+        while True:
+            items = [await self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            for _item in items:
+                self.process_message(_item.channel, _item.data)
+            self.processed_messages += len(items)
+            await self.write_log_entries()
+            await self.consumer.ack(items)
+
+    async def report_status(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            await self.redis_connection.set(
+                STATUS_KEY, json.dumps(self.get_status())
+            )
+            self.max_backlog = 0
+
+    async def run(self):
+        await asyncio.gather(self.receive(), self.consume(), self.report_status())
+
+
+async def main():
     logger = PressureLogger()
-    logger.run()
+    await logger.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+import struct
+import numpy as np
+
+# resolutions of the rollups in seconds.
+RESOLUTIONS = (60, 600, 3600, 86400)
+# utc of the start of the interval, mean pressure in Pa, mean temperature in
+# degree Celsius, mean humidity in percent (NaN if unknown), sample count.
+RECORD = struct.Struct("<IfffI")
+RECORD_DTYPE = np.dtype(
+    [
+        ("utc", "<u4"),
+        ("pressure", "<f4"),
+        ("temperature", "<f4"),
+        ("humidity", "<f4"),
+        ("count", "<u4"),
+    ]
+)
+assert RECORD.size == RECORD_DTYPE.itemsize
+# time span kept per resolution in seconds, None for unlimited.
+RETENTION = {60: 30 * 86400, 600: 365 * 86400, 3600: 5 * 365 * 86400}
+# a string is trimmed to its retention when it exceeds it by this fraction.
+TRIM_MARGIN = 0.1
+
+
+def get_key(hostname, resolution):
+    return f"pressure_rollup:{hostname}:{resolution}"
+
+
+def get_resolution(key):
+    return int(key.rsplit(":", 1)[1])
+
+
+def select_resolution(utc_min, utc_max, max_points):
+    """
+    returns the finest resolution which covers the time range with at most
+    max_points records or the coarsest resolution if none does.
+    """
+    for _resolution in RESOLUTIONS:
+        if (utc_max - utc_min) / _resolution <= max_points:
+            return _resolution
+    return RESOLUTIONS[-1]
+
+
+class _Interval:
+    def __init__(self, utc):
+        self.utc = utc
+        self.count = 0
+        self.pressure_sum = 0.0
+        self.temperature_sum = 0.0
+        self.humidity_sum = 0.0
+        self.humidity_count = 0
+
+    def add(self, pressure, temperature, humidity, count):
+        self.count += count
+        self.pressure_sum += pressure * count
+        self.temperature_sum += temperature * count
+        if humidity is not None:
+            self.humidity_sum += humidity * count
+            self.humidity_count += count
+
+    def pack(self):
+        return RECORD.pack(
+            self.utc,
+            self.pressure_sum / self.count,
+            self.temperature_sum / self.count,
+            (
+                self.humidity_sum / self.humidity_count
+                if self.humidity_count
+                else np.nan
+            ),
+            self.count,
+        )
+
+
+class PressureRollup:
+    """
+    aggregates one minute means of a host to all resolutions. Each finished
+    interval becomes a fixed-size record which is appended to the Redis
+    string of its resolution. The records of a string are ordered by time.
+    """
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self._intervals = {}
+        self._last_utc = {}
+
+    async def load(self, redis_connection):
+        """
+        continues after the last stored records to keep the records sorted
+        after a restart or if the system time was set back. The connection
+        has to return bytes.
+        """
+        for _resolution in RESOLUTIONS:
+            data = await redis_connection.getrange(
+                get_key(self.hostname, _resolution), -RECORD.size, -1
+            )
+            if len(data) == RECORD.size:
+                self._last_utc[_resolution] = RECORD.unpack(data)[0]
+
+    def add(self, utc, pressure, temperature, humidity=None, count=1):
+        """
+        adds the mean of the minute starting at utc and returns the finished
+        records as list of (key, record) to be appended.
+        """
+        records = []
+        for _resolution in RESOLUTIONS:
+            interval_utc = int(utc - utc % _resolution)
+            interval = self._intervals.get(_resolution)
+            if interval is not None and interval.utc != interval_utc:
+                records.extend(self._finish(_resolution))
+                interval = None
+            if interval is None:
+                interval = _Interval(interval_utc)
+                self._intervals[_resolution] = interval
+            interval.add(pressure, temperature, humidity, count)
+            if utc + 60 >= interval_utc + _resolution:
+                records.extend(self._finish(_resolution))
+        return records
+
+    def _finish(self, resolution):
+        interval = self._intervals.pop(resolution)
+        # ignore intervals which are not newer than the last one, e.g. after
+        # the system time was set back.
+        if interval.utc <= self._last_utc.get(resolution, -1):
+            return []
+        self._last_utc[resolution] = interval.utc
+        return [(get_key(self.hostname, resolution), interval.pack())]
+
+
+async def trim(redis_connection, key, length):
+    """
+    removes the oldest records of a string of the given length in bytes
+    which exceeds the retention of its resolution. The connection has to
+    return bytes and the caller has to be the only writer of the key.
+    """
+    resolution = get_resolution(key)
+    retention = RETENTION.get(resolution)
+    if retention is None:
+        return
+    size = retention // resolution * RECORD.size
+    if length <= size * (1 + TRIM_MARGIN):
+        return
+    data = await redis_connection.getrange(key, length - size, length - 1)
+    await redis_connection.set(key, data)
+
+
+async def _bisect(redis_connection, key, count, utc):
+    """
+    returns the index of the first of count records with a utc not below
+    the given one.
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        offset = middle * RECORD.size
+        data = await redis_connection.getrange(key, offset, offset + 3)
+        if struct.unpack("<I", data)[0] < utc:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+async def read_records(redis_connection, key, utc_min, utc_max):
+    """
+    returns the records within the utc limits as structured array. The
+    connection has to return bytes.
+    """
+    count = await redis_connection.strlen(key) // RECORD.size
+    start = await _bisect(redis_connection, key, count, utc_min)
+    stop = await _bisect(redis_connection, key, count, utc_max + 1)
+    if stop <= start:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    data = await redis_connection.getrange(
+        key, start * RECORD.size, stop * RECORD.size - 1
+    )
+    return np.frombuffer(data, dtype=RECORD_DTYPE)
+
+
+async def get_pressure_history(
+    redis_connection, hostname, utc_min, utc_max, max_points
+):
+    resolution = select_resolution(utc_min, utc_max, max_points)
+    records = await read_records(
+        redis_connection, get_key(hostname, resolution), utc_min, utc_max
+    )
+    humidity = np.round(records["humidity"].astype(float), 1)
+    return {
+        "hostname": hostname,
+        "resolution": resolution,
+        "utc": records["utc"].tolist(),
+        "pressure": np.round(records["pressure"].astype(float), 1).tolist(),
+        "temperature": np.round(
+            records["temperature"].astype(float), 2
+        ).tolist(),
+        "humidity": [
+            None if np.isnan(_value) else _value for _value in humidity.tolist()
+        ],
+        "count": records["count"].tolist(),
+    }
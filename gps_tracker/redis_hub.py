@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from redis import asyncio as aioredis
+
+# number of messages buffered per client before the oldest are dropped.
+CLIENT_QUEUE_SIZE = 10
+# waiting time before resubscribing after a lost Redis connection.
+RECONNECT_DELAY = 1.0
+
+
+class RedisHub:
+    """
+    shares one Redis subscription per channel between all clients of the
+    API process. Each message is received once and put into the bounded
+    queue of every client of the channel. If a client does not keep up, its
+    oldest messages are dropped instead of delaying the other clients.
+    The latest message of each channel is kept together with the time of
+    its arrival.
+    """
+
+    def __init__(self, redis_host):
+        self.redis_connection = aioredis.Redis(
+            host=redis_host, decode_responses=True
+        )
+        self.dropped_messages = 0
+        self._queues = {}
+        self._tasks = {}
+        self._latest = {}
+        self._permanent_channels = set()
+
+    def subscribe(self, channel, maxsize=CLIENT_QUEUE_SIZE):
+        """
+        returns a queue receiving the messages of the channel.
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        self._queues.setdefault(channel, set()).add(queue)
+        if channel not in self._tasks:
+            self._tasks[channel] = asyncio.create_task(self._listen(channel))
+        return queue
+
+    def keep_latest(self, *channels):
+        """
+        subscribes permanently to the channels to keep their latest message
+        available.
+        """
+        for _channel in channels:
+            self._permanent_channels.add(_channel)
+            if _channel not in self._tasks:
+                self._tasks[_channel] = asyncio.create_task(
+                    self._listen(_channel)
+                )
+
+    def get_latest(self, channel):
+        """
+        returns the latest message of the channel and its age in seconds or
+        None if no message was received.
+        """
+        latest = self._latest.get(channel)
+        if latest is None:
+            return None
+        data, arrival = latest
+        return data, time.monotonic() - arrival
+
+    def unsubscribe(self, channel, queue):
+        queues = self._queues.get(channel, set())
+        queues.discard(queue)
+        if (
+            not queues
+            and channel in self._tasks
+            and channel not in self._permanent_channels
+        ):
+            self._tasks.pop(channel).cancel()
+            self._latest.pop(channel, None)
+
+    def _broadcast(self, channel, data):
+        self._latest[channel] = (data, time.monotonic())
+        for _queue in self._queues.get(channel, ()):
+            if _queue.full():
+                _queue.get_nowait()
+                self.dropped_messages += 1
+            _queue.put_nowait(data)
+
+    async def _listen(self, channel):
+        while True:
+            pubsub = self.redis_connection.pubsub(
+                ignore_subscribe_messages=True
+            )
+            try:
+                await pubsub.subscribe(channel)
+                async for message in pubsub.listen():
+                    self._broadcast(channel, message["data"])
+            except aioredis.ConnectionError:
+                logging.exception(f"subscription of '{channel}' lost")
+                await asyncio.sleep(RECONNECT_DELAY)
+            except Exception:
+                # any other error must not end the listener of the channel.
+                logging.exception(f"subscription of '{channel}' failed")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await pubsub.close()
+
+    async def close(self):
+        for _task in self._tasks.values():
+            _task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        await self.redis_connection.close()
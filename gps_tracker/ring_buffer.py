@@ -0,0 +1,102 @@
+import numpy as np
+
+# fields interpolated to the time of a GPS epoch with their lengths.
+PRESSURE_FIELDS = {"pressure": 1, "temperature": 1, "humidity": 1}
+IMU_FIELDS = {"gyro": 3}
+
+
+class TimeRingBuffer:
+    """
+    keeps the latest samples of a sensor ordered by time with a fixed
+    capacity. Each sample is written twice, at i and at i + capacity, so that
+    the samples in time order are always a contiguous slice which can be
+    bisected. The numeric fields are stored in a NumPy array for
+    interpolation, the other fields are taken from the nearest sample.
+    """
+
+    def __init__(self, capacity, fields, utc_key, max_gap=1.0, max_age=0.5):
+        self.capacity = capacity
+        self.fields = fields
+        self.utc_key = utc_key
+        self.max_gap = max_gap
+        self.max_age = max_age
+        self._columns = {}
+        column = 0
+        for _name, _length in fields.items():
+            self._columns[_name] = (column, _length)
+            column += _length
+        self._utc = np.zeros(2 * capacity)
+        self._values = np.full((2 * capacity, column), np.nan)
+        self._samples = [None] * capacity
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, sample):
+        """
+        adds a sample. Samples which are not newer than the latest one are
+        ignored.
+        """
+        utc = sample[self.utc_key]
+        if self._count and utc <= self._utc[self._start + self._count - 1]:
+            return
+        if self._count == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._count -= 1
+        position = (self._start + self._count) % self.capacity
+        row = np.full(self._values.shape[1], np.nan)
+        for _name, (_column, _length) in self._columns.items():
+            value = sample.get(_name)
+            if value is not None:
+                row[_column : _column + _length] = value
+        for _position in (position, position + self.capacity):
+            self._utc[_position] = utc
+            self._values[_position] = row
+        self._samples[position] = sample
+        self._count += 1
+
+    def _sample_data(self, index, values, utc):
+        data = dict(self._samples[(self._start + index) % self.capacity])
+        for _name, (_column, _length) in self._columns.items():
+            value = values[_column : _column + _length]
+            if np.isnan(value).any():
+                data.pop(_name, None)
+            elif _length == 1:
+                data[_name] = round(float(value[0]), 3)
+            else:
+                data[_name] = np.round(value, 3).tolist()
+        data[self.utc_key] = round(utc, 3)
+        return data
+
+    def interpolate(self, utc):
+        """
+        returns a sample at the given time. Its numeric fields are linearly
+        interpolated between the neighbouring samples and the other fields
+        are taken from the nearest one. Returns None if no sample is close
+        enough. The buffer is not modified.
+        """
+        utc_window = self._utc[self._start : self._start + self._count]
+        values = self._values[self._start : self._start + self._count]
+        index = int(np.searchsorted(utc_window, utc))
+        if index == self._count:
+            # no newer sample yet, use the latest one without extrapolation.
+            if index == 0 or utc - utc_window[-1] > self.max_age:
+                return None
+            return self._sample_data(index - 1, values[-1], utc)
+        if utc_window[index] == utc:
+            return self._sample_data(index, values[index], utc)
+        if index == 0:
+            return None
+        t_0, t_1 = utc_window[index - 1], utc_window[index]
+        nearest = index - 1 if utc - t_0 <= t_1 - utc else index
+        if t_1 - t_0 > self.max_gap:
+            if abs(utc - utc_window[nearest]) > self.max_age:
+                return None
+            return self._sample_data(nearest, values[nearest], utc)
+        weight = (utc - t_0) / (t_1 - t_0)
+        interpolated = values[index - 1] + weight * (
+            values[index] - values[index - 1]
+        )
+        return self._sample_data(nearest, interpolated, utc)
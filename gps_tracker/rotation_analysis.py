@@ -5,6 +5,10 @@ import numpy as np
 import time
 import gyr_calibration
 
+# single imu messages are processed again if no imu_batch message arrived for
+# this time in seconds, e.g. after a restart of the poller without FIFO.
+BATCH_TIMEOUT = 1.0
+
 
 def heading_diff(new_heading: float, old_heading: float) -> float:
     difference = new_heading - old_heading
@@ -63,7 +67,7 @@ class RotationAnalysis:
     def __init__(self):
         self.redis_connection = redis.Redis(decode_responses=True)
         self._pubsub = self.redis_connection.pubsub()
-        self._pubsub.subscribe("imu")
+        self._pubsub.subscribe("imu", "imu_batch")
         self.old_rotations = self._get_stored_value("rotations", 0)
         self.old_compass_rotations = self._get_stored_value(
             "compass_rotations", 0
@@ -75,6 +79,7 @@ class RotationAnalysis:
         self.min_trip_duration = 120
         self.archive = False
         self.last_msg = None
+        self.last_batch_utc = None
         self.compass = Compass(self.old_compass_rotations)
         self.gyro = Gyro(self.old_rotations)
 
@@ -88,19 +93,38 @@ class RotationAnalysis:
 
         data = json.loads(item["data"])
 
-        if item["channel"] == "imu":
+        if item["channel"] == "imu" and not self.batches_available(data):
             self.process_imu_data(data)
+        elif item["channel"] == "imu_batch":
+            self.process_imu_batch(data)
+
+    def batches_available(self, data):
+        # the batches contain all samples of the imu channel.
+        return (
+            self.last_batch_utc is not None
+            and data["i_utc"] - self.last_batch_utc < BATCH_TIMEOUT
+        )
 
     def process_imu_data(self, data):
         angular_rate = data["gyro"][2]
         timestamp = data["i_utc"]
         self.gyro.set_gyro_data(angular_rate, timestamp)
+        self.process_rotations(data, timestamp)
+
+    def process_imu_batch(self, data):
+        for i, _gyro in enumerate(data["gyro"]):
+            timestamp = data["i_utc"] + i * data["interval"]
+            self.gyro.set_gyro_data(_gyro[2], timestamp)
+        self.last_batch_utc = timestamp
+        self.process_rotations(data, timestamp)
+
+    def process_rotations(self, data, timestamp):
         mag_x = data["raw_magnetometer"][0]
         mag_y = data["raw_magnetometer"][1]
         self.compass.set_mag_data(mag_x, mag_y)
 
         if self.on_trip:
-            trip_duration = data["i_utc"] - self.trip_start
+            trip_duration = timestamp - self.trip_start
 
         if self.gyro.rpm > self.min_trip_speed and not self.on_trip:
             self.on_trip = True
@@ -1,12 +1,20 @@
 import json
 import os
+import time
 from pathlib import Path
 from typing import Union
 from redis import asyncio as aioredis
-from fastapi import APIRouter, Query, HTTPException
-from geojson import FeatureCollection, Feature, LineString
-from algorithms import calculate_pressure_altitude
-from gebco import Gebco
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from track_profile import TrackArrays, height_profiles
+import utc_index
+import pressure_rollup
+from columnar_archive import (
+    columnar_directory,
+    get_columnar_archive,
+    write_columnar_archive,
+)
 
 if "REDIS_HOST" in os.environ:
     redis_host = os.environ["REDIS_HOST"]
@@ -14,25 +22,121 @@ else:
     redis_host = "127.0.0.1"
 router = APIRouter()
 log_directory = Path("../logs_json")
+# number of rows read from Redis per LRANGE call in streaming mode.
+STREAM_CHUNK_SIZE = 1000
 
 
-def split_track_segments(tracking_data, delta_t=600):
+async def _get_redis_bounds(redis_connection, key, utc_min=None, utc_max=None):
     """
-    split tracking data into segments where the time gap is larger than delta_t.
+    returns the range [start, stop) of rows in time order within the utc
+    limits. The oldest row has the row number 0.
     """
-    index_list = (
-        [None]
-        + [
-            i
-            for i in range(1, len(tracking_data))
-            if tracking_data[i]["utc"] - tracking_data[i - 1]["utc"] > delta_t
-        ]
-        + [None]
+    if utc_min is None and utc_max is None:
+        return 0, await redis_connection.llen(key)
+    return await utc_index.get_redis_bounds(
+        redis_connection, key, utc_min, utc_max, STREAM_CHUNK_SIZE
     )
-    return [
-        tracking_data[index_list[j - 1] : index_list[j]]
-        for j in range(1, len(index_list))
-    ]
+
+
+def _get_archive_byte_range(file_name, utc_min=None, utc_max=None):
+    if utc_min is None and utc_max is None:
+        return 0, file_name.stat().st_size
+    return utc_index.get_file_byte_range(file_name, utc_min, utc_max)
+
+
+async def _read_redis_rows(key, utc_min=None, utc_max=None):
+    redis_connection = aioredis.Redis(host=redis_host, decode_responses=True)
+    start, stop = await _get_redis_bounds(
+        redis_connection, key, utc_min, utc_max
+    )
+    if stop <= start:
+        return []
+    # Rows are added by LPUSH, so the row number n in time order has the
+    # index -(n + 1). These indices remain valid while new rows are added.
+    reversed_data = await redis_connection.lrange(key, -stop, -start - 1)
+    data = ",\n".join(reversed_data[::-1])
+    return json.loads(f"[{data}]")
+
+
+def _read_archive_rows(_id, utc_min=None, utc_max=None):
+    columnar_archive = get_columnar_archive(_id)
+    if columnar_archive is not None:
+        return columnar_archive.rows(
+            *columnar_archive.bounds(utc_min, utc_max)
+        )
+    file_name = log_directory.joinpath(f"{_id}.json")
+    start, stop = _get_archive_byte_range(file_name, utc_min, utc_max)
+    with file_name.open("rb") as f:
+        f.seek(start)
+        data = f.read(stop - start).strip().lstrip(b"[").rstrip(b",]")
+    return json.loads(b"[" + data + b"]")
+
+
+def _read_archive_track(_id, utc_min=None, utc_max=None):
+    columnar_archive = get_columnar_archive(_id)
+    if columnar_archive is not None:
+        return TrackArrays.from_columnar_archive(
+            columnar_archive, *columnar_archive.bounds(utc_min, utc_max)
+        )
+    return TrackArrays.from_rows(_read_archive_rows(_id, utc_min, utc_max))
+
+
+async def _redis_row_chunks(key, utc_min=None, utc_max=None):
+    """
+    yields the rows of a Redis list in time order in chunks of
+    STREAM_CHUNK_SIZE.
+    """
+    redis_connection = aioredis.Redis(host=redis_host)
+    try:
+        start, stop = await _get_redis_bounds(
+            redis_connection, key, utc_min, utc_max
+        )
+        for chunk_start in range(start, stop, STREAM_CHUNK_SIZE):
+            chunk_stop = min(chunk_start + STREAM_CHUNK_SIZE, stop)
+            reversed_chunk = await redis_connection.lrange(
+                key, -chunk_stop, -chunk_start - 1
+            )
+            yield reversed_chunk[::-1]
+    finally:
+        await redis_connection.close()
+
+
+def _archive_row_chunks(file_name, utc_min=None, utc_max=None):
+    """
+    yields the rows of an archived dataset in chunks of STREAM_CHUNK_SIZE.
+    move_to_archive writes one row per line.
+    """
+    start, stop = _get_archive_byte_range(file_name, utc_min, utc_max)
+    chunk = []
+    with file_name.open("rb") as f:
+        f.seek(start)
+        offset = start
+        for _line in f:
+            if offset >= stop:
+                break
+            offset += len(_line)
+            _raw_row = _line.strip().lstrip(b"[").rstrip(b",]")
+            if _raw_row:
+                chunk.append(_raw_row)
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _stream_json_array(row_chunks):
+    """
+    writes the rows as a JSON array to the client while only a single chunk
+    of rows is held in memory.
+    """
+    yield b"["
+    separator = b""
+    async for _chunk in row_chunks:
+        if _chunk:
+            yield separator + b",\n".join(_chunk)
+            separator = b",\n"
+    yield b"]\n"
 
 
 @router.get("/api/available_datasets")
@@ -66,29 +170,47 @@ async def get_dataset(
     utc_min: Union[int, None] = None,
     utc_max: Union[int, None] = None,
     from_archive: bool = Query(False),
+    stream: bool = Query(False),
 ):
-    if from_archive:
-        with log_directory.joinpath(f"{_id}.json").open() as f:
-            tracking_data = json.load(f)
-    else:
-        redis_connection = aioredis.Redis(
-            host=redis_host, decode_responses=True
-        )
-        reversed_data = await redis_connection.lrange(
-            _id.replace("_", ":"), 0, -1
+    key = _id.replace("_", ":")
+    file_name = log_directory.joinpath(f"{_id}.json")
+    if from_archive and not file_name.is_file():
+        raise HTTPException(status_code=404, detail="dataset unknown.")
+    if stream:
+        if from_archive:
+            row_chunks = iterate_in_threadpool(
+                _archive_row_chunks(file_name, utc_min, utc_max)
+            )
+        else:
+            row_chunks = _redis_row_chunks(key, utc_min, utc_max)
+        return StreamingResponse(
+            _stream_json_array(row_chunks), media_type="application/json"
         )
-        data = ",\n".join(reversed_data[::-1])
-        tracking_data = json.loads(f"[{data}]\n")
-    return [
-        _row
-        for _row in tracking_data
-        if not (utc_min is not None and _row["utc"] < utc_min)
-        and not (utc_max is not None and _row["utc"] > utc_max)
-    ]
+    if from_archive:
+        return _read_archive_rows(_id, utc_min, utc_max)
+    return await _read_redis_rows(key, utc_min, utc_max)
+
+
+@router.get("/api/pressure_history")
+async def get_pressure_history(
+    hostname: str,
+    utc_min: Union[int, None] = None,
+    utc_max: Union[int, None] = None,
+    max_points: int = Query(1000, gt=0, le=100000),
+):
+    if utc_max is None:
+        utc_max = int(time.time())
+    if utc_min is None:
+        utc_min = utc_max - 86400
+    # the rollup records are binary.
+    redis_connection = aioredis.Redis(host=redis_host)
+    return await pressure_rollup.get_pressure_history(
+        redis_connection, hostname, utc_min, utc_max, max_points
+    )
 
 
 @router.get("/api/move_to_archive/{_id}")
-async def move_to_archive(_id):
+async def move_to_archive(_id, columnar: bool = Query(False)):
     redis_connection = aioredis.Redis(host=redis_host, decode_responses=True)
     key = _id.replace("_", ":")
     file_name = log_directory.joinpath(f"{_id}.json")
@@ -102,6 +224,16 @@ async def move_to_archive(_id):
     # compare to written or existing data.
     existing_data = file_name.read_text()
     if existing_data == json_string:
+        if columnar and get_columnar_archive(_id) is None:
+            try:
+                await run_in_threadpool(
+                    write_columnar_archive,
+                    columnar_directory.joinpath(_id),
+                    json.loads(json_string),
+                )
+            except (ValueError, OSError) as e:
+                # keep the dataset in Redis.
+                raise HTTPException(status_code=500, detail=str(e))
         # delete dataset from Redis only if a copy exists.
         await redis_connection.delete(key)
     else:
@@ -114,6 +246,7 @@ async def move_to_archive(_id):
 @router.get("/api/dataset/{_id}.geojson")
 async def get_geojson_dataset(
     _id: str,
+    request: Request,
     show_pressure_altitude: bool = Query(True),
     show_gps_altitude: bool = Query(False),
     show_gebco_altitude: bool = Query(False),
@@ -122,93 +255,19 @@ async def get_geojson_dataset(
     utc_max: Union[int, None] = None,
     from_archive: bool = Query(False),
 ):
+    gebco = request.app.state.gebco if show_gebco_altitude else None
+    if show_gebco_altitude and gebco is None:
+        raise HTTPException(status_code=404, detail="GEBCO data not found.")
     if from_archive:
-        with log_directory.joinpath(f"{_id}.json").open() as f:
-            tracking_data = json.load(f)
+        track = _read_archive_track(_id, utc_min, utc_max)
     else:
-        redis_connection = aioredis.Redis(
-            host=redis_host, decode_responses=True
-        )
-        reversed_data = await redis_connection.lrange(
-            _id.replace("_", ":"), 0, -1
+        track = TrackArrays.from_rows(
+            await _read_redis_rows(_id.replace("_", ":"), utc_min, utc_max)
         )
-        data = ",\n".join(reversed_data[::-1])
-        tracking_data = json.loads(f"[{data}]")
-    track_segments = split_track_segments(tracking_data)
-    height_data = []
-    if show_gps_altitude:
-        _features = []
-        for _segment in track_segments:
-            _coords = [
-                [row["lon"], row["lat"], row["alt"]]
-                for row in _segment
-                if row.get("alt") is not None
-                and not (row.get("hdop") is not None and row["hdop"] > 20)
-                and not (utc_min is not None and row["utc"] < utc_min)
-                and not (utc_max is not None and row["utc"] > utc_max)
-            ]
-            if len(_coords) == 0:
-                continue
-            _feature = Feature(geometry=LineString(_coords))
-            _features.append(_feature)
-        if len(_features) > 0:
-            _feature_collection = FeatureCollection(
-                _features, properties={"summary": "GPS altitude"}
-            )
-            height_data.append(_feature_collection)
-    if show_pressure_altitude:
-        _features = []
-        for _segment in track_segments:
-            _coords = [
-                [
-                    row["lon"],
-                    row["lat"],
-                    round(
-                        calculate_pressure_altitude(
-                            pressure=row["pressure"], p0=ref_pressure_mbar * 100
-                        ),
-                        2,
-                    ),
-                ]
-                for row in _segment
-                if row.get("pressure") is not None
-                and row.get("alt") is not None
-                and not (row.get("hdop") is not None and row["hdop"] > 20)
-                and not (utc_min is not None and row["utc"] < utc_min)
-                and not (utc_max is not None and row["utc"] > utc_max)
-            ]
-            if len(_coords) == 0:
-                continue
-            _feature = Feature(geometry=LineString(_coords))
-            _features.append(_feature)
-        if len(_features) > 0:
-            _feature_collection = FeatureCollection(
-                _features, properties={"summary": "barometric altitude"}
-            )
-            height_data.append(_feature_collection)
-    if show_gebco_altitude:
-        _gebco = Gebco()
-        _features = []
-        for _segment in track_segments:
-            _coords = [
-                [
-                    row["lon"],
-                    row["lat"],
-                    _gebco.get_height(row["lat"], row["lon"])["altitude_m"],
-                ]
-                for row in _segment
-                if row.get("alt") is not None
-                and not (row.get("hdop") is not None and row["hdop"] > 20)
-                and not (utc_min is not None and row["utc"] < utc_min)
-                and not (utc_max is not None and row["utc"] > utc_max)
-            ]
-            if len(_coords) == 0:
-                continue
-            _feature = Feature(geometry=LineString(_coords))
-            _features.append(_feature)
-        if len(_features) > 0:
-            _feature_collection = FeatureCollection(
-                _features, properties={"summary": "GEBCO altitude"}
-            )
-            height_data.append(_feature_collection)
-    return height_data
+    return height_profiles(
+        track,
+        show_pressure_altitude=show_pressure_altitude,
+        show_gps_altitude=show_gps_altitude,
+        gebco=gebco,
+        ref_pressure_mbar=ref_pressure_mbar,
+    )
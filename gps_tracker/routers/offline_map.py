@@ -1,31 +1,143 @@
+import os
+import queue
 import sqlite3
 import json
+import threading
+from contextlib import contextmanager
 from fastapi import APIRouter, HTTPException, Request, Response
 from pathlib import Path
+from byte_cache import ByteLRUCache, MISSING
 
 router = APIRouter(tags=["offline_map"])
 
 osm_path = Path("../..")
 natural_earth_vector_path = Path("natural_earth_vector.mbtiles")
 natural_earth_shaded_relief_path = Path("natural_earth_2_shaded_relief.mbtiles")
+# maximum number of open connections per mbtiles file.
+POOL_SIZE = 4
+# maximum waiting time for a connection of an exhausted pool in seconds.
+POOL_TIMEOUT = 10
+# size of the memory-mapped part of each mbtiles file.
+MMAP_SIZE = 256 * 2**20
+# memory budget of the tile cache including cached misses.
+TILE_CACHE_MB = int(os.environ.get("TILE_CACHE_MB", 32))
+# estimated memory overhead of each cache entry.
+TILE_ENTRY_OVERHEAD = 200
+TILE_QUERY = (
+    "SELECT tile_data FROM tiles "
+    "WHERE zoom_level = ? and tile_column = ? and tile_row = ?"
+)
 
 
-def get_db_connection(db_file_name: Path):
-    if not db_file_name.is_file():
-        raise HTTPException(
-            status_code=404, detail=f"File '{db_file_name}' not found."
+class MbtilesPool:
+    """
+    pool of read-only connections to an mbtiles file. Each connection is
+    used by a single thread at a time. sqlite3 keeps the prepared tile query
+    in the statement cache of each connection.
+    """
+
+    def __init__(self, db_file_name: Path, size: int = POOL_SIZE):
+        self.db_file_name = db_file_name
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        db_connection = sqlite3.connect(
+            f"file:{self.db_file_name}?mode=ro",
+            uri=True,
+            check_same_thread=False,
         )
-    return sqlite3.connect(f"file:{db_file_name}?mode=ro", uri=True)
+        try:
+            db_connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        except sqlite3.Error:
+            db_connection.close()
+            raise
+        return db_connection
+
+    def _create(self):
+        try:
+            return self._connect()
+        except Exception:
+            # give the slot back, e.g. for a corrupt file.
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def connection(self):
+        try:
+            db_connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                db_connection = self._create()
+            else:
+                try:
+                    db_connection = self._idle.get(timeout=POOL_TIMEOUT)
+                except queue.Empty:
+                    raise HTTPException(
+                        status_code=503, detail="No database connection."
+                    )
+        try:
+            yield db_connection
+        finally:
+            self._idle.put(db_connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# cached tiles keyed by (source, zoom_level, tile_column, tile_row).
+# Tiles which were not found are stored as None.
+tile_cache = ByteLRUCache(TILE_CACHE_MB * 2**20)
+
+
+def get_db_connection(db_file_name: Path):
+    """
+    returns a connection of the pool of db_file_name as context manager.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_file_name)
+        if pool is None:
+            if not db_file_name.is_file():
+                raise HTTPException(
+                    status_code=404, detail=f"File '{db_file_name}' not found."
+                )
+            pool = MbtilesPool(db_file_name)
+            _pools[db_file_name] = pool
+    return pool.connection()
 
 
 def fetch_tile_data(db_connection, zoom_level, tile_column, tile_row):
     cursor = db_connection.execute(
-        "SELECT tile_data FROM tiles WHERE zoom_level = ? and tile_column = ? and tile_row = ?",
-        (zoom_level, tile_column, tile_row),
+        TILE_QUERY, (zoom_level, tile_column, tile_row)
     )
     return cursor.fetchone()
 
 
+def get_tile(db_file_name: Path, zoom_level, tile_column, tile_row):
+    """
+    returns the tile data from the cache or the mbtiles file or None if the
+    tile does not exist.
+    """
+    key = (str(db_file_name), zoom_level, tile_column, tile_row)
+    tile_data = tile_cache.get(key)
+    if tile_data is not MISSING:
+        return tile_data
+    with get_db_connection(db_file_name) as db_connection:
+        result = fetch_tile_data(
+            db_connection, zoom_level, tile_column, tile_row
+        )
+    tile_data = None if result is None else result[0]
+    size = TILE_ENTRY_OVERHEAD + (0 if tile_data is None else len(tile_data))
+    tile_cache.put(key, tile_data, size)
+    return tile_data
+
+
 @router.get("/api/vector/regions")
 def list_vector_regions():
     mbtiles_files = sorted(
@@ -72,19 +184,15 @@ def get_vector_tiles(region: str, zoom_level: int, x: int, y: int):
     tile_column = x
     tile_row = 2**zoom_level - 1 - y
     db_file_name = osm_path / f"{region}.mbtiles"
-    with get_db_connection(db_file_name) as db_connection:
-        result = fetch_tile_data(
-            db_connection, zoom_level, tile_column, tile_row
+    tile_data = get_tile(db_file_name, zoom_level, tile_column, tile_row)
+    if tile_data is None and zoom_level <= 7:
+        tile_data = get_tile(
+            natural_earth_vector_path, zoom_level, tile_column, tile_row
         )
-    if result is None and zoom_level <= 7:
-        with get_db_connection(natural_earth_vector_path) as db_connection:
-            result = fetch_tile_data(
-                db_connection, zoom_level, tile_column, tile_row
-            )
-    if result is None:
+    if tile_data is None:
         raise HTTPException(status_code=404, detail="Tile not found.")
     return Response(
-        content=result[0],
+        content=tile_data,
         media_type="application/octet-stream",
         headers={"Content-Encoding": "gzip"},
     )
@@ -123,10 +231,14 @@ def get_vector_style(region: str, style_name: str, request: Request):
 def get_raster_natural_earth_2_shaded_relief(zoom_level: int, x: int, y: int):
     tile_column = x
     tile_row = 2**zoom_level - 1 - y
-    with get_db_connection(natural_earth_shaded_relief_path) as db_connection:
-        result = fetch_tile_data(
-            db_connection, zoom_level, tile_column, tile_row
-        )
-    if result is None:
+    tile_data = get_tile(
+        natural_earth_shaded_relief_path, zoom_level, tile_column, tile_row
+    )
+    if tile_data is None:
         raise HTTPException(status_code=404, detail="Tile not found.")
-    return Response(content=result[0], media_type="image/webp")
+    return Response(content=tile_data, media_type="image/webp")
+
+
+@router.get("/api/tile_cache/stats")
+def get_tile_cache_stats():
+    return tile_cache.get_stats()
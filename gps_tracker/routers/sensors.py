@@ -5,8 +5,16 @@ import logging
 from typing import List
 import numpy as np
 from redis import asyncio as aioredis
-from fastapi import APIRouter, HTTPException, Request, Response, WebSocket, status
-from ellipsoid_fit import ellipsoid_fit, data_regularize
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
+from ellipsoid_fit import ellipsoid_fit, data_regularize, sphere_transform
 import gyr_calibration
 
 router = APIRouter()
@@ -15,31 +23,28 @@ if "REDIS_HOST" in os.environ:
     redis_host = os.environ["REDIS_HOST"]
 else:
     redis_host = "127.0.0.1"
+# channels whose latest message is always kept by the API.
+LATEST_VALUE_CHANNELS = ("barometer", "imu")
+# maximum age in seconds of the data returned by the current value endpoints.
+MAX_DATA_AGE = 1.0
 
 
-async def _get_channel_data(channel):
-    redis_connection = aioredis.Redis(host=redis_host, decode_responses=True)
-    pubsub = redis_connection.pubsub(ignore_subscribe_messages=True)
-    await pubsub.subscribe(channel)
-    while True:
-        message = await pubsub.get_message()
-        if message is not None:
-            _channel = message["channel"]
-            _data = json.loads(message["data"])
-            _data["channel"] = _channel
-            return _data
-        await asyncio.sleep(0.01)
+def _get_latest_data(request: Request, channel: str, max_age: float):
+    latest = request.app.state.redis_hub.get_latest(channel)
+    if latest is None or latest[1] > max_age:
+        raise HTTPException(status_code=404, detail="no data available")
+    message, age = latest
+    data = json.loads(message)
+    data["channel"] = channel
+    data["age"] = round(age, 3)
+    return data
 
 
 @router.get("/api/current_pressure")
-async def get_current_pressure():
-    channel = "barometer"
-    try:
-        pressure_data = await asyncio.wait_for(_get_channel_data(channel), 0.2)
-    except asyncio.TimeoutError:
-        logging.exception("/api/current_pressure")
-        raise HTTPException(status_code=404, detail="no data available")
-    return pressure_data
+async def get_current_pressure(
+    request: Request, max_age: float = Query(MAX_DATA_AGE, gt=0)
+):
+    return _get_latest_data(request, "barometer", max_age)
 
 
 @router.get("/api/calibrate_gyro")
@@ -48,14 +53,10 @@ def calibrate_gyro():
 
 
 @router.get("/api/current_orientation")
-async def get_current_orientation():
-    channel = "imu"
-    try:
-        imu_data = await asyncio.wait_for(_get_channel_data(channel), 0.2)
-    except asyncio.TimeoutError:
-        logging.exception("/api/current_orientation")
-        raise HTTPException(status_code=404, detail="no data available")
-    return imu_data
+async def get_current_orientation(
+    request: Request, max_age: float = Query(MAX_DATA_AGE, gt=0)
+):
+    return _get_latest_data(request, "imu", max_age)
 
 
 async def redis_connector(
@@ -69,31 +70,26 @@ async def redis_connector(
         async for message in websocket.iter_text():
             await redis_connection.publish(target_channel, message)
 
-    async def producer_handler(
-        pubsub: aioredis.client.PubSub,
-        websocket: WebSocket,
-        source_channel: str,
-    ):
-        await pubsub.subscribe(source_channel)
-        async for message in pubsub.listen():
-            await websocket.send_text(message["data"])
+    async def producer_handler(queue: asyncio.Queue, websocket: WebSocket):
+        while True:
+            await websocket.send_text(await queue.get())
 
-    redis_connection = aioredis.Redis(host=redis_host, decode_responses=True)
-    pubsub = redis_connection.pubsub(ignore_subscribe_messages=True)
+    redis_hub = websocket.app.state.redis_hub
+    queue = redis_hub.subscribe(source_channel)
     consumer_task = asyncio.create_task(
-        consumer_handler(redis_connection, websocket, target_channel)
+        consumer_handler(redis_hub.redis_connection, websocket, target_channel)
     )
-    producer_task = asyncio.create_task(
-        producer_handler(pubsub, websocket, source_channel)
-    )
-    done, pending = await asyncio.wait(
-        [consumer_task, producer_task], return_when=asyncio.FIRST_COMPLETED
-    )
-    logging.debug(f"Done task: {done}")
-    for task in pending:
-        logging.debug(f"Cancelling task: {task}")
-        task.cancel()
-    await redis_connection.close()
+    producer_task = asyncio.create_task(producer_handler(queue, websocket))
+    try:
+        done, pending = await asyncio.wait(
+            [consumer_task, producer_task], return_when=asyncio.FIRST_COMPLETED
+        )
+        logging.debug(f"Done task: {done}")
+    finally:
+        for task in (consumer_task, producer_task):
+            logging.debug(f"Cancelling task: {task}")
+            task.cancel()
+        redis_hub.unsubscribe(source_channel, queue)
 
 
 @router.websocket("/ws/{channel}")
@@ -115,19 +111,47 @@ async def websocket_endpoint(websocket: WebSocket, channel: str):
     )
 
 
+async def _save_magnetometer_calibration(redis_connection, calibration):
+    for _key in ("m_matrix", "m_offset"):
+        await redis_connection.set(_key, json.dumps(calibration[_key]))
+    await redis_connection.set("calibration_updated", 1)
+    await redis_connection.publish("calibration_updated", 1)
+
+
 @router.post("/api/calibrate_magnetometer")
-async def calibrate_magnetometer(data: List):
+async def calibrate_magnetometer(request: Request, data: List):
     # based on https://github.com/aleksandrbazhin/ellipsoid_fit_python
     center, evecs, radii, v = ellipsoid_fit(
         data_regularize(np.array(data), divs=8)
     )
-    a, b, c = radii
-    r = (a * b * c) ** (1.0 / 3.0)
-    D = np.array([[r / a, 0.0, 0.0], [0.0, r / b, 0.0], [0.0, 0.0, r / c]])
-    # http://www.cs.brandeis.edu/~cs155/Lecture_07_6.pdf
     # affine transformation from ellipsoid to sphere (translation excluded)
-    TR = evecs.dot(D).dot(evecs.T)
+    TR = sphere_transform(evecs, radii)
     calibration = {"m_matrix": TR.tolist(), "m_offset": center.tolist()}
-    for _key, _value in calibration.items():
-        await redis_connection.set(_key, json.dumps(_value))
+    await _save_magnetometer_calibration(
+        request.app.state.redis_hub.redis_connection, calibration
+    )
+    return calibration
+
+
+@router.get("/api/magnetometer_calibration")
+async def get_magnetometer_calibration(request: Request):
+    calibration = request.app.state.magnetometer_calibration.get_calibration()
+    if calibration is None:
+        raise HTTPException(status_code=404, detail="not enough data")
+    return calibration
+
+
+@router.post("/api/magnetometer_calibration/reset")
+async def reset_magnetometer_calibration(request: Request):
+    request.app.state.magnetometer_calibration.reset()
+
+
+@router.post("/api/magnetometer_calibration/save")
+async def save_magnetometer_calibration(request: Request):
+    calibration = request.app.state.magnetometer_calibration.get_calibration()
+    if calibration is None:
+        raise HTTPException(status_code=404, detail="not enough data")
+    await _save_magnetometer_calibration(
+        request.app.state.redis_hub.redis_connection, calibration
+    )
     return calibration
@@ -0,0 +1,218 @@
+#!venv/bin/python3
+import asyncio
+import json
+import logging
+import os
+import time
+import smbus2
+from redis import asyncio as aioredis
+from barometer_poller import get_barometer_sensor
+from lsm_poller import get_lsm_sensor
+from transport import queue_message
+
+BAROMETER_INTERVAL = float(os.getenv("BAROMETER_INTERVAL", 0.08))
+IMU_INTERVAL = float(os.getenv("IMU_INTERVAL", 0.05))
+# drain the FIFO of a BMP388 in bursts instead of reading single samples.
+BAROMETER_FIFO = os.getenv("BAROMETER_FIFO", "0") == "1"
+FIFO_READ_INTERVAL = float(os.getenv("FIFO_READ_INTERVAL", 0.4))
+# sample an LSM6DSL at 416Hz and publish its batches on the imu_batch channel
+# in addition to the latest sample on the imu channel.
+IMU_FIFO = os.getenv("IMU_FIFO", "0") == "1"
+# interval of the timing statistics written to Redis and to the log.
+STATS_INTERVAL = 60
+STATS_KEY = "sensor_scheduler_stats"
+
+
+class ScheduledSensor:
+    """
+    reads a sensor on a fixed grid of monotonic times. The grid does not
+    drift with the duration of the reads. Grid points which already passed
+    when a read finished are skipped instead of being caught up.
+    """
+
+    def __init__(self, name, read, interval, start):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.due = start
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.duration_max = 0.0
+
+    def sample(self, now):
+        """
+        reads the sensor and returns its messages as list of
+        (channel, data) pairs.
+        """
+        jitter = now - self.due
+        try:
+            messages = self.read()
+        except Exception:
+            # a faulty sensor must not stop the others on the bus.
+            logging.exception(f"reading {self.name} failed")
+            self.errors += 1
+            messages = []
+        finished = time.monotonic()
+        self.samples += 1
+        self.jitter_sum += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        self.duration_max = max(self.duration_max, finished - now)
+        self.due += self.interval
+        if finished >= self.due:
+            missed = int((finished - self.due) // self.interval) + 1
+            self.overruns += 1
+            self.skipped += missed
+            self.due += missed * self.interval
+        return messages
+
+    def get_stats(self):
+        return {
+            "interval": self.interval,
+            "samples": self.samples,
+            "errors": self.errors,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "mean_jitter_ms": (
+                round(self.jitter_sum / self.samples * 1e3, 3)
+                if self.samples
+                else None
+            ),
+            "max_jitter_ms": round(self.jitter_max * 1e3, 3),
+            "max_duration_ms": round(self.duration_max * 1e3, 3),
+        }
+
+
+class SensorScheduler:
+    """
+    drives all sensors sharing one I2C bus from a single event loop. The
+    messages of all sensors due at the same time are published through one
+    pipelined Redis request.
+    """
+
+    def __init__(self, redis_connection):
+        self.redis_connection = redis_connection
+        self.sensors = []
+
+    def add(self, name, read, interval):
+        self.sensors.append(
+            ScheduledSensor(name, read, interval, time.monotonic())
+        )
+
+    async def _publish(self, messages):
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        for channel, data in messages:
+            queue_message(pipeline, channel, json.dumps(data))
+        try:
+            await pipeline.execute()
+        except aioredis.ConnectionError:
+            logging.exception("publishing sensor data failed")
+
+    async def _report_stats(self):
+        stats = {_sensor.name: _sensor.get_stats() for _sensor in self.sensors}
+        logging.info(f"sensor timing: {stats}")
+        try:
+            await self.redis_connection.set(STATS_KEY, json.dumps(stats))
+        except aioredis.ConnectionError:
+            logging.exception("writing sensor statistics failed")
+        for _sensor in self.sensors:
+            _sensor.reset_stats()
+
+    async def run(self):
+        next_report = time.monotonic() + STATS_INTERVAL
+        while True:
+            delay = min(_sensor.due for _sensor in self.sensors)
+            delay -= time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            messages = []
+            for _sensor in self.sensors:
+                now = time.monotonic()
+                if _sensor.due <= now:
+                    messages.extend(_sensor.sample(now))
+            if messages:
+                await self._publish(messages)
+            if time.monotonic() >= next_report:
+                next_report += STATS_INTERVAL
+                await self._report_stats()
+
+
+def create_scheduler(redis_connection, bus):
+    """
+    adds every detected sensor to a new scheduler. If a barometer and an IMU
+    are present, the combined imu_barometer channel is published like by
+    imu_baro_poller.py.
+    """
+    scheduler = SensorScheduler(redis_connection)
+    barometer = get_barometer_sensor(bus, fifo=BAROMETER_FIFO)
+    imu = get_lsm_sensor(bus, fifo=IMU_FIFO)
+    combined = barometer is not None and imu is not None
+    barometer_fifo = getattr(barometer, "fifo", False)
+    imu_fifo = getattr(imu, "fifo", False)
+    latest_barometer_data = {}
+
+    def read_barometer():
+        if barometer_fifo:
+            samples = barometer.get_fifo_data()
+        else:
+            samples = [barometer.get_sensor_data()]
+        if samples:
+            latest_barometer_data.update(samples[-1])
+        messages = []
+        for _data in samples:
+            if combined:
+                _data = {**_data, "imu_barometer_available": True}
+            messages.append(("barometer", _data))
+        return messages
+
+    def read_imu():
+        messages = []
+        if imu_fifo:
+            batch, data = imu.get_fifo_data()
+            if batch is None:
+                return messages
+            messages.append(("imu_batch", batch))
+        else:
+            data = imu.get_sensor_data(sensor_fusion=False)
+        if not combined:
+            messages.append(("imu", data))
+            return messages
+        messages.append(("imu", {**data, "imu_barometer_available": True}))
+        if latest_barometer_data:
+            data.update(latest_barometer_data)
+            messages.append(("imu_barometer", data))
+        return messages
+
+    if barometer_fifo:
+        scheduler.add("barometer", read_barometer, FIFO_READ_INTERVAL)
+    elif barometer is not None:
+        scheduler.add("barometer", read_barometer, BAROMETER_INTERVAL)
+    if imu is not None:
+        scheduler.add("imu", read_imu, IMU_INTERVAL)
+    return scheduler
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    redis_connection = aioredis.Redis()
+    bus = smbus2.SMBus(1)
+    scheduler = create_scheduler(redis_connection, bus)
+    if not scheduler.sensors:
+        print("No sensor found. Exiting.")
+        return
+    try:
+        await scheduler.run()
+    finally:
+        bus.close()
+        await redis_connection.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
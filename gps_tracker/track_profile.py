@@ -0,0 +1,130 @@
+import numpy as np
+from algorithms import calculate_pressure_altitude
+
+# rows with a larger horizontal dilution of precision are ignored.
+MAX_HDOP = 20
+# precision of the coordinates as applied by the geojson package.
+COORDINATE_PRECISION = 6
+TRACK_FIELDS = ("utc", "lat", "lon", "alt", "pressure", "hdop")
+
+
+class TrackArrays:
+    """
+    track data held as one NumPy array per field. Missing values are NaN.
+    """
+
+    def __init__(self, columns):
+        for _name in TRACK_FIELDS:
+            setattr(self, _name, np.asarray(columns[_name], dtype=float))
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(
+            {
+                _name: np.array([_row.get(_name) for _row in rows], dtype=float)
+                for _name in TRACK_FIELDS
+            }
+        )
+
+    @classmethod
+    def from_columnar_archive(cls, archive, start, stop):
+        columns = {}
+        for _name in TRACK_FIELDS:
+            column = archive.column(_name)
+            if column is None:
+                columns[_name] = np.full(stop - start, np.nan)
+            else:
+                columns[_name] = column[start:stop]
+        return cls(columns)
+
+    def segment_ids(self, delta_t=600):
+        """
+        numbers the segments of the track which are separated by time gaps
+        larger than delta_t.
+        """
+        if len(self.utc) == 0:
+            return np.zeros(0, dtype=int)
+        return np.concatenate(([0], np.cumsum(np.diff(self.utc) > delta_t)))
+
+
+def _feature_collection(lon, lat, altitude, segment_ids, summary):
+    """
+    returns a FeatureCollection with one LineString per track segment or None
+    if no coordinates are left.
+    """
+    if len(lon) == 0:
+        return None
+    coordinates = np.round(
+        np.column_stack((lon, lat, altitude)), COORDINATE_PRECISION
+    )
+    # NaN is not valid JSON, e.g. the GEBCO altitude of invalid coordinates.
+    coordinates = np.where(
+        np.isnan(coordinates), None, coordinates.astype(object)
+    ).tolist()
+    splits = [0, *(np.flatnonzero(np.diff(segment_ids)) + 1), len(lon)]
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "LineString",
+                "coordinates": coordinates[splits[i] : splits[i + 1]],
+            },
+            "properties": {},
+        }
+        for i in range(len(splits) - 1)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "properties": {"summary": summary},
+        "features": features,
+    }
+
+
+def height_profiles(
+    track: TrackArrays,
+    show_pressure_altitude=True,
+    show_gps_altitude=False,
+    gebco=None,
+    ref_pressure_mbar=1013.25,
+):
+    """
+    returns the requested altitude profiles of the track as list of
+    FeatureCollections. The GEBCO profile is added if gebco is given.
+    """
+    segment_ids = track.segment_ids()
+    valid = ~np.isnan(track.alt) & ~(track.hdop > MAX_HDOP)
+    height_data = []
+    if show_gps_altitude:
+        height_data.append(
+            _feature_collection(
+                track.lon[valid],
+                track.lat[valid],
+                track.alt[valid],
+                segment_ids[valid],
+                "GPS altitude",
+            )
+        )
+    if show_pressure_altitude:
+        mask = valid & ~np.isnan(track.pressure)
+        pressure_altitude = calculate_pressure_altitude(
+            pressure=track.pressure[mask], p0=ref_pressure_mbar * 100
+        )
+        height_data.append(
+            _feature_collection(
+                track.lon[mask],
+                track.lat[mask],
+                np.round(pressure_altitude, 2),
+                segment_ids[mask],
+                "barometric altitude",
+            )
+        )
+    if gebco is not None:
+        lat = track.lat[valid]
+        lon = track.lon[valid]
+        gebco_altitude = gebco.get_heights(lat, lon)
+        height_data.append(
+            _feature_collection(
+                lon, lat, gebco_altitude, segment_ids[valid], "GEBCO altitude"
+            )
+        )
+    return [_item for _item in height_data if _item is not None]
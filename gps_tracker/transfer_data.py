@@ -1,53 +1,212 @@
 #!/usr/bin/env python3
-import redis
+import asyncio
+import base64
+import gzip
 import json
-import requests
-from collections import deque
-from time import sleep, time
-
-redis_connection = redis.Redis(decode_responses=True)
-_pubsub = redis_connection.pubsub()
-_pubsub.subscribe(["transfer_data"])
-
-with open("/home/pi/gps_config.json") as json_data_file:
-    config = json.load(json_data_file)
-
-transfer_deque = deque()
-max_pause = config["transfer"]["max_pause"]
-min_pause = config["transfer"]["min_pause"]
-post_url = config["transfer"]["post_url"]
-password = config["transfer"]["password"]
-
-last_transfer = None
-ts = transfer_deque
-message_buffer = deque()
-
-for item in _pubsub.listen():
-    if not item[u"type"] == "message":
-        continue
-    ts.append(json.loads(item["data"]))
-    if (
-        len(ts) > 30
-        or last_transfer is None
-        or (last_transfer < time() - max_pause and len(ts) > 0)
+import logging
+import os
+import time
+from urllib.parse import urlencode
+import httpx
+import orjson
+from redis import asyncio as aioredis
+from transport import get_async_consumer
+from compact_format import encode_batch
+
+CONFIG_FILE = os.getenv("GPS_CONFIG", "/home/pi/gps_config.json")
+CONSUMER_GROUP = "transfer_data"
+# Redis list of the rows which are not uploaded yet. It survives restarts
+# and periods without network coverage. The oldest rows are dropped above
+# SPOOL_MAXLEN.
+SPOOL_KEY = "transfer_spool"
+SPOOL_MAXLEN = int(os.getenv("TRANSFER_SPOOL_MAXLEN", 100000))
+# The batch size is doubled after each full successful upload and halved
+# after each failure.
+MIN_BATCH_SIZE = 5
+INITIAL_BATCH_SIZE = 30
+MAX_BATCH_SIZE = 500
+# limits of the exponential backoff after failed uploads in seconds.
+MIN_BACKOFF = 2.0
+MAX_BACKOFF = 300.0
+REQUEST_TIMEOUT = 10
+
+
+class UploadError(Exception):
+    pass
+
+
+class Uploader:
+    """
+    moves the transfer_data messages into a spool list in Redis and posts
+    the spooled rows in batches over one keep-alive connection. Rows are
+    removed from the spool only after the server confirmed them, so that
+    they are retried after failures and restarts. The form fields of a
+    batch are the same as before unless the compact format is chosen. The
+    body may be compressed with gzip if the server supports it.
+    """
+
+    def __init__(
+        self,
+        redis_connection,
+        post_url,
+        password,
+        min_pause=1.0,
+        max_pause=30,
+        compress=False,
+        compact=False,
+        http_client=None,
     ):
-        text_data = {"password": password}
-        line_count = 0
-        while len(ts) > 0 and len(message_buffer) < 30:
-            data = dict(ts.popleft())
-            line_key = "line_%d" % line_count
-            text_data[line_key] = json.dumps(data, separators=(",", ":"))
-            message_buffer.append(data)
-            line_count += 1
-        text_data["num_lines"] = len(message_buffer)
-        t = time()
-        r = requests.post(post_url, data=text_data, timeout=10)
-        if r.status_code == 200 and r.text.startswith("success"):
-            last_transfer = time()
-            data["transferred"] = last_transfer
-            redis_connection.publish("last_transfer", json.dumps(data))
-            message_buffer.clear()
-        dt = time() - t
-        while len(message_buffer) > 0:
-            ts.appendleft(dict(message_buffer.pop()))
-    sleep(min_pause)
+        self.redis_connection = redis_connection
+        self.post_url = post_url
+        self.password = password
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+        self.compress = compress
+        self.compact = compact
+        self.http_client = http_client or httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=1, keepalive_expiry=300),
+        )
+        self.batch_size = INITIAL_BATCH_SIZE
+        self.backoff = 0.0
+        self.last_transfer = None
+        self._new_rows = asyncio.Event()
+
+    async def receive(self):
+        """spools the received messages and acknowledges them."""
+        consumer = get_async_consumer(
+            self.redis_connection, ["transfer_data"], CONSUMER_GROUP
+        )
+        while True:
+            messages = await consumer.read()
+            if not messages:
+                continue
+            # normalized to the compact JSON of the upload.
+            await self.redis_connection.rpush(
+                SPOOL_KEY,
+                *(orjson.dumps(orjson.loads(_m.data)) for _m in messages),
+            )
+            await consumer.ack(messages)
+            self._new_rows.set()
+
+    def encode_batch(self, rows):
+        """returns the headers and the body of the post of the rows."""
+        form = {"password": self.password}
+        if self.compact:
+            # see compact_format.py for the format and its decoder.
+            blob = encode_batch([orjson.loads(_row) for _row in rows])
+            form["format"] = "compact"
+            form["data"] = base64.urlsafe_b64encode(blob).rstrip(b"=")
+        else:
+            for _index, _row in enumerate(rows):
+                form[f"line_{_index}"] = _row
+        form["num_lines"] = len(rows)
+        body = urlencode(form).encode()
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return headers, body
+
+    async def post(self, rows):
+        headers, body = self.encode_batch(rows)
+        try:
+            response = await self.http_client.post(
+                self.post_url, content=body, headers=headers
+            )
+        except httpx.HTTPError as e:
+            raise UploadError(repr(e))
+        if response.status_code != 200 or not response.text.startswith(
+            "success"
+        ):
+            raise UploadError(
+                f"{response.status_code}: {response.text[:100]!r}"
+            )
+
+    async def _wait_for_rows(self):
+        """waits until the spool is due for an upload."""
+        while True:
+            # cleared before reading the length, so that rows spooled in the
+            # meantime end the wait below.
+            self._new_rows.clear()
+            spooled = await self.redis_connection.llen(SPOOL_KEY)
+            if spooled and (
+                spooled >= self.batch_size
+                or self.last_transfer is None
+                or time.time() - self.last_transfer >= self.max_pause
+            ):
+                return
+            timeout = None
+            if spooled:
+                timeout = self.last_transfer + self.max_pause - time.time()
+            try:
+                await asyncio.wait_for(self._new_rows.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def upload_batch(self):
+        """
+        posts the oldest spooled rows. Returns the number of uploaded rows
+        or raises UploadError.
+        """
+        spooled = await self.redis_connection.llen(SPOOL_KEY)
+        if spooled > SPOOL_MAXLEN:
+            await self.redis_connection.ltrim(SPOOL_KEY, -SPOOL_MAXLEN, -1)
+            logging.warning(f"dropped {spooled - SPOOL_MAXLEN} spooled rows")
+        rows = await self.redis_connection.lrange(
+            SPOOL_KEY, 0, self.batch_size - 1
+        )
+        if not rows:
+            return 0
+        await self.post(rows)
+        # only the uploader removes rows from the head of the spool.
+        await self.redis_connection.ltrim(SPOOL_KEY, len(rows), -1)
+        self.last_transfer = time.time()
+        data = json.loads(rows[-1])
+        data["transferred"] = self.last_transfer
+        await self.redis_connection.publish("last_transfer", json.dumps(data))
+        return len(rows)
+
+    async def upload(self):
+        while True:
+            await self._wait_for_rows()
+            try:
+                count = await self.upload_batch()
+            except UploadError as e:
+                self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+                self.backoff = min(
+                    MAX_BACKOFF, max(MIN_BACKOFF, 2 * self.backoff)
+                )
+                logging.warning(
+                    f"upload failed ({e}), retry in {self.backoff:.0f}s "
+                    f"with {self.batch_size} rows"
+                )
+                await asyncio.sleep(self.backoff)
+                continue
+            self.backoff = 0.0
+            if count == self.batch_size:
+                self.batch_size = min(MAX_BATCH_SIZE, 2 * self.batch_size)
+            await asyncio.sleep(self.min_pause)
+
+    async def run(self):
+        async with self.http_client:
+            await asyncio.gather(self.receive(), self.upload())
+
+
+async def main():
+    with open(CONFIG_FILE) as json_data_file:
+        config = json.load(json_data_file)
+    uploader = Uploader(
+        aioredis.Redis(decode_responses=True),
+        config["transfer"]["post_url"],
+        config["transfer"]["password"],
+        config["transfer"]["min_pause"],
+        config["transfer"]["max_pause"],
+        config["transfer"].get("gzip", False),
+        config["transfer"].get("format") == "compact",
+    )
+    await uploader.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
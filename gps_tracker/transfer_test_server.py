@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import gzip
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from compact_format import decode_batch
+
+
+class TransferHandler(BaseHTTPRequestHandler):
+    """
+    stands in for the server receiving the posts of transfer_data.py. The
+    received rows of both formats are checked and appended to a JSON lines
+    file. Failures and slow responses may be simulated.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, status, text):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(server.delay)
+        if random.random() < server.failure_rate:
+            self._respond(503, "simulated failure")
+            return
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        form = {
+            _key: _values[0]
+            for _key, _values in parse_qs(body.decode()).items()
+        }
+        if form.get("password") != server.password:
+            self._respond(403, "wrong password")
+            return
+        try:
+            num_lines = int(form.get("num_lines", 0))
+            if form.get("format") == "compact":
+                data = form["data"]
+                rows = decode_batch(
+                    base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+                )
+            else:
+                rows = [
+                    json.loads(form[f"line_{_index}"])
+                    for _index in range(num_lines)
+                ]
+        except (KeyError, ValueError) as e:
+            self._respond(400, f"invalid data: {e!r}")
+            return
+        if len(rows) != num_lines:
+            self._respond(400, "wrong number of lines")
+            return
+        with open(server.output_file, "a") as output_file:
+            for _row in rows:
+                output_file.write(json.dumps(_row) + "\n")
+        server.posts += 1
+        server.rows += num_lines
+        print(
+            f"post {server.posts}: {num_lines} rows, {len(body)} bytes, "
+            f"{server.rows} rows in total"
+        )
+        self._respond(200, "success")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the transfer_data.py post_url."
+    )
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--password", default="my_password")
+    parser.add_argument("--output", default="received_rows.jsonl")
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="fraction of posts answered with 503 to simulate coverage gaps",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="response delay in seconds"
+    )
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("", args.port), TransferHandler)
+    server.password = args.password
+    server.output_file = args.output
+    server.failure_rate = args.failure_rate
+    server.delay = args.delay
+    server.posts = 0
+    server.rows = 0
+    print(f"listening on http://localhost:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import socket
+import logging
+from collections import namedtuple
+from redis import asyncio as aioredis
+
+# "pubsub" or "streams". Messages are always published for the websockets
+# of the API. With "streams" they are also added to a Redis stream per
+# channel which is read by the consumer group of each service.
+SENSOR_TRANSPORT = os.getenv("SENSOR_TRANSPORT", "pubsub")
+USE_STREAMS = SENSOR_TRANSPORT == "streams"
+# approximate number of messages kept per stream.
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", 10000))
+# maximum number of messages returned by one read.
+STREAM_READ_COUNT = int(os.getenv("STREAM_READ_COUNT", 100))
+STREAM_BLOCK_MS = 1000
+# channels which are added to streams. Large messages like imu_batch are
+# only published.
+STREAM_CHANNELS = {"gps", "barometer", "imu", "imu_barometer", "transfer_data"}
+
+Message = namedtuple("Message", ("channel", "data", "stream", "id"))
+
+
+def get_stream_key(channel):
+    return f"stream:{channel}"
+
+
+def queue_message(pipeline, channel, message):
+    """adds the commands sending the message to a sync or async pipeline."""
+    pipeline.publish(channel, message)
+    if USE_STREAMS and channel in STREAM_CHANNELS:
+        pipeline.xadd(
+            get_stream_key(channel),
+            {"data": message},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+
+
+def publish_message(redis_connection, channel, message):
+    pipeline = redis_connection.pipeline(transaction=False)
+    queue_message(pipeline, channel, message)
+    pipeline.execute()
+
+
+async def publish_message_async(redis_connection, channel, message):
+    pipeline = redis_connection.pipeline(transaction=False)
+    queue_message(pipeline, channel, message)
+    await pipeline.execute()
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _stream_id(message):
+    milliseconds, sequence = _decode(message.id).split("-")
+    return int(milliseconds), int(sequence)
+
+
+class _StreamConsumerBase:
+    """
+    reads the streams of the channels as member of a consumer group. At
+    start the messages which were delivered to this consumer but not
+    acknowledged before a restart are read again, then new ones follow.
+    Messages of one read are ordered by their stream IDs across the
+    streams. The consumer name defaults to the hostname, which keeps it
+    stable across restarts.
+    """
+
+    def __init__(
+        self,
+        redis_connection,
+        channels,
+        group,
+        count=STREAM_READ_COUNT,
+        consumer=None,
+    ):
+        self.redis_connection = redis_connection
+        self.group = group
+        self.count = count
+        self.consumer = consumer or socket.gethostname()
+        self._channels = {
+            get_stream_key(_channel): _channel for _channel in channels
+        }
+        self._ids = {}
+        self._groups_created = False
+
+    def _reset_ids(self):
+        # "0" reads the pending entries of this consumer, ">" new ones.
+        self._ids = {_stream: "0" for _stream in self._channels}
+
+    def _parse(self, response):
+        messages = []
+        deleted = []
+        for _stream, _entries in response or []:
+            stream = _decode(_stream)
+            if self._ids[stream] != ">":
+                if not _entries:
+                    self._ids[stream] = ">"
+                    continue
+                self._ids[stream] = _decode(_entries[-1][0])
+            for _id, _fields in _entries:
+                if not _fields:
+                    # trimmed from the stream while pending.
+                    deleted.append(Message(None, None, stream, _id))
+                    continue
+                data = _fields.get(b"data", _fields.get("data"))
+                messages.append(
+                    Message(self._channels[stream], data, stream, _id)
+                )
+        messages.sort(key=_stream_id)
+        return messages, deleted
+
+    def _queue_acks(self, pipeline, messages):
+        ids = {}
+        for _message in messages:
+            ids.setdefault(_message.stream, []).append(_message.id)
+        for _stream, _ids in ids.items():
+            pipeline.xack(_stream, self.group, *_ids)
+        return bool(ids)
+
+
+class AsyncStreamConsumer(_StreamConsumerBase):
+    async def _create_groups(self):
+        for _stream in self._channels:
+            try:
+                await self.redis_connection.xgroup_create(
+                    _stream, self.group, id="$", mkstream=True
+                )
+            except aioredis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._reset_ids()
+        self._groups_created = True
+
+    async def read(self):
+        """
+        returns the next list of messages. Blocks up to one second if no
+        messages are available. The messages have to be acknowledged
+        after processing.
+        """
+        if not self._groups_created:
+            await self._create_groups()
+        try:
+            response = await self.redis_connection.xreadgroup(
+                self.group,
+                self.consumer,
+                self._ids,
+                count=self.count,
+                block=STREAM_BLOCK_MS,
+            )
+        except aioredis.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            logging.warning(f"recreating consumer group {self.group}")
+            self._groups_created = False
+            return []
+        messages, deleted = self._parse(response)
+        await self.ack(deleted)
+        return messages
+
+    async def ack(self, messages):
+        """acknowledges the messages in one pipeline."""
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        if self._queue_acks(pipeline, messages):
+            await pipeline.execute()
+
+
+class AsyncPubSubConsumer:
+    """
+    provides the subscribed channels with the interface of
+    AsyncStreamConsumer. A read returns all messages already received, up to
+    count. Nothing has to be acknowledged and messages sent during a restart
+    are lost.
+    """
+
+    def __init__(self, redis_connection, channels, count=STREAM_READ_COUNT):
+        self.count = count
+        self._pubsub = redis_connection.pubsub(ignore_subscribe_messages=True)
+        self._channels = channels
+        self._subscribed = False
+
+    def _message(self, item):
+        return Message(_decode(item["channel"]), item["data"], None, None)
+
+    async def read(self):
+        if not self._subscribed:
+            await self._pubsub.subscribe(*self._channels)
+            self._subscribed = True
+        item = None
+        while item is None:
+            item = await self._pubsub.get_message(timeout=None)
+        messages = [self._message(item)]
+        while len(messages) < self.count:
+            item = await self._pubsub.get_message(timeout=0.0)
+            if item is None:
+                break
+            messages.append(self._message(item))
+        return messages
+
+    async def ack(self, messages):
+        pass
+
+
+def get_async_consumer(redis_connection, channels, group):
+    """returns the consumer of the configured transport."""
+    if USE_STREAMS:
+        return AsyncStreamConsumer(redis_connection, channels, group)
+    return AsyncPubSubConsumer(redis_connection, channels)
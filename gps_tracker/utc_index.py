@@ -0,0 +1,172 @@
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+import orjson
+
+# maximum number of datasets for which an index is kept in memory.
+MAX_INDEXES = 32
+# number of rows read from Redis per LRANGE call while building an index.
+CHUNK_SIZE = 1000
+
+
+class _UtcArray:
+    """
+    growing array of utc values in time order.
+    """
+
+    def __init__(self):
+        self._utc = np.empty(1024)
+        self.length = 0
+
+    def append(self, utc_values):
+        new_length = self.length + len(utc_values)
+        if new_length > len(self._utc):
+            capacity = max(new_length, 2 * len(self._utc))
+            self._utc = np.resize(self._utc, capacity)
+        self._utc[self.length : new_length] = utc_values
+        self.length = new_length
+
+    def clear(self):
+        self.length = 0
+
+    @property
+    def utc(self):
+        return self._utc[: self.length]
+
+    def bounds(self, utc_min=None, utc_max=None):
+        """
+        returns the range [start, stop) of row numbers within the utc limits
+        found by bisection.
+        """
+        utc = self.utc
+        start = 0 if utc_min is None else np.searchsorted(utc, utc_min, "left")
+        stop = (
+            self.length
+            if utc_max is None
+            else np.searchsorted(utc, utc_max, "right")
+        )
+        return int(start), int(max(start, stop))
+
+
+class RedisUtcIndex:
+    """
+    utc index of the rows in a tracking list in Redis. Rows are added by
+    LPUSH, so the row number n in time order has the list index -(n + 1).
+    On each update only the rows pushed since the previous update are read
+    in chunks of chunk_size rows.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.lock = asyncio.Lock()
+        self._utc_array = _UtcArray()
+
+    async def update(self, redis_connection, chunk_size=CHUNK_SIZE):
+        length = await redis_connection.llen(self.key)
+        if 0 < self._utc_array.length <= length:
+            # make sure that the list has not been replaced in the meantime.
+            oldest_row = await redis_connection.lindex(self.key, -1)
+            if orjson.loads(oldest_row)["utc"] != self._utc_array.utc[0]:
+                self._utc_array.clear()
+        elif length < self._utc_array.length:
+            self._utc_array.clear()
+        for chunk_start in range(self._utc_array.length, length, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, length)
+            reversed_rows = await redis_connection.lrange(
+                self.key, -chunk_stop, -chunk_start - 1
+            )
+            self._utc_array.append(
+                [orjson.loads(_row)["utc"] for _row in reversed(reversed_rows)]
+            )
+
+    def bounds(self, utc_min=None, utc_max=None):
+        return self._utc_array.bounds(utc_min, utc_max)
+
+
+class FileUtcIndex:
+    """
+    utc index of an archived dataset with one row per line. Besides the utc
+    values, the byte offset of each line is stored. The index is rebuilt
+    if the file is modified.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self._utc_array = _UtcArray()
+        self._offsets = np.empty(0, dtype=np.int64)
+        self._file_state = None
+
+    def update(self):
+        stat = self.file_name.stat()
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if file_state == self._file_state:
+            return
+        self._utc_array.clear()
+        offsets = []
+        utc_values = []
+        offset = 0
+        with self.file_name.open("rb") as f:
+            for _line in f:
+                _raw_row = _line.strip().lstrip(b"[").rstrip(b",]")
+                if _raw_row:
+                    offsets.append(offset)
+                    utc_values.append(orjson.loads(_raw_row)["utc"])
+                offset += len(_line)
+        offsets.append(offset)
+        self._utc_array.append(utc_values)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._file_state = file_state
+
+    def bounds(self, utc_min=None, utc_max=None):
+        return self._utc_array.bounds(utc_min, utc_max)
+
+    def byte_range(self, start, stop):
+        """
+        returns the byte offsets enclosing the rows [start, stop).
+        """
+        return int(self._offsets[start]), int(self._offsets[stop])
+
+
+_redis_indexes = OrderedDict()
+_file_indexes = OrderedDict()
+_file_indexes_lock = threading.Lock()
+
+
+def _get_cached(indexes, key, factory):
+    index = indexes.get(key)
+    if index is None:
+        index = factory(key)
+        indexes[key] = index
+        if len(indexes) > MAX_INDEXES:
+            indexes.popitem(last=False)
+    else:
+        indexes.move_to_end(key)
+    return index
+
+
+async def get_redis_bounds(
+    redis_connection, key, utc_min=None, utc_max=None, chunk_size=CHUNK_SIZE
+):
+    """
+    returns the range [start, stop) of rows in time order of the Redis list
+    key within the utc limits.
+    """
+    index = _get_cached(_redis_indexes, key, RedisUtcIndex)
+    async with index.lock:
+        await index.update(redis_connection, chunk_size)
+        return index.bounds(utc_min, utc_max)
+
+
+def get_file_byte_range(file_name, utc_min=None, utc_max=None):
+    """
+    returns the byte offsets of the rows of an archived dataset within the
+    utc limits.
+    """
+    with _file_indexes_lock:
+        index = _get_cached(_file_indexes, file_name, FileUtcIndex)
+    with index.lock:
+        index.update()
+        start, stop = index.bounds(utc_min, utc_max)
+        return index.byte_range(start, stop)
@@ -0,0 +1,167 @@
+import math
+from functools import lru_cache
+from types import SimpleNamespace
+import numpy as np
+
+# WGS84 ellipsoid and UTM parameters
+A = 6378137.0
+F = 1 / 298.257223563
+K0 = 0.9996
+FALSE_EASTING = 500e3
+FALSE_NORTHING = 10000e3
+E = math.sqrt(F * (2 - F))
+N = F / (2 - F)
+# rectifying radius scaled by K0
+A0 = A / (1 + N) * (1 + N**2 / 4 + N**4 / 64 + N**6 / 256) * K0
+# coefficients of the Krüger series, Karney 2011 Eq 35
+ALPHA = (
+    N / 2
+    - 2 * N**2 / 3
+    + 5 * N**3 / 16
+    + 41 * N**4 / 180
+    - 127 * N**5 / 288
+    + 7891 * N**6 / 37800,
+    13 * N**2 / 48
+    - 3 * N**3 / 5
+    + 557 * N**4 / 1440
+    + 281 * N**5 / 630
+    - 1983433 * N**6 / 1935360,
+    61 * N**3 / 240
+    - 103 * N**4 / 140
+    + 15061 * N**5 / 26880
+    + 167603 * N**6 / 181440,
+    49561 * N**4 / 161280 - 179 * N**5 / 168 + 6601661 * N**6 / 7257600,
+    34729 * N**5 / 80640 - 3418889 * N**6 / 1995840,
+    212378941 * N**6 / 319334400,
+)
+UTM_LAT_MIN = -80
+UTM_LAT_MAX = 84
+BANDS = "CDEFGHJKLMNPQRSTUVWXX"
+# Svalbard zones which are not used and the longitude splitting them.
+SVALBARD_ZONES = {32: 9, 34: 21, 36: 33}
+# MGRS 100km grid square letters
+MGRS_COLUMNS = ("ABCDEFGH", "JKLMNPQR", "STUVWXYZ")
+MGRS_ROWS = ("ABCDEFGHJKLMNPQRSTUV", "FGHJKLMNPQRSTUVABCDE")
+
+_numpy_math = SimpleNamespace(
+    sin=np.sin,
+    cos=np.cos,
+    tan=np.tan,
+    sinh=np.sinh,
+    cosh=np.cosh,
+    atan2=np.arctan2,
+    asinh=np.arcsinh,
+    atanh=np.arctanh,
+    hypot=np.hypot,
+    sqrt=np.sqrt,
+)
+
+
+@lru_cache(maxsize=64)
+def get_zone_band(lat_degree, lon_degree):
+    """
+    returns zone, band letter and central meridian for the one degree cell
+    with the given integer latitude and longitude in [-180, 180). All zone and
+    band limits are at integer degrees.
+    """
+    band = BANDS[(lat_degree - UTM_LAT_MIN) >> 3]
+    zone = (lon_degree + 180) // 6 + 1
+    if band == "X" and zone in SVALBARD_ZONES:
+        zone += 1 if lon_degree >= SVALBARD_ZONES[zone] else -1
+    elif band == "V" and zone == 31 and lon_degree >= 3:
+        # south western Norway
+        zone += 1
+    return zone, band, zone * 6 - 183
+
+
+def _transverse_mercator(lat, dlon, m):
+    """
+    returns easting and northing relative to the central meridian and the
+    equator by Karney's method. m provides the math functions for scalars
+    (math) or arrays (_numpy_math).
+    """
+    sin_dlon, cos_dlon = m.sin(dlon), m.cos(dlon)
+    tau = m.tan(lat)
+    sec = m.sqrt(1 + tau * tau)
+    sigma = m.sinh(E * m.atanh(E * tau / sec))
+    tau_ = tau * m.sqrt(1 + sigma * sigma) - sigma * sec
+    xi_ = m.atan2(tau_, cos_dlon)
+    eta_ = m.asinh(sin_dlon / m.hypot(tau_, cos_dlon))
+    xi, eta = xi_, eta_
+    for j, _alpha in enumerate(ALPHA, 1):
+        xi = xi + _alpha * m.sin(2 * j * xi_) * m.cosh(2 * j * eta_)
+        eta = eta + _alpha * m.cos(2 * j * xi_) * m.sinh(2 * j * eta_)
+    return eta * A0, xi * A0
+
+
+def to_utm(lat, lon):
+    """
+    returns zone, band, hemisphere, easting and northing of the position.
+    """
+    if not UTM_LAT_MIN <= lat < UTM_LAT_MAX:
+        raise ValueError(f"latitude {lat} outside UTM range.")
+    lon = (lon + 180) % 360 - 180
+    zone, band, central_meridian = get_zone_band(
+        math.floor(lat), math.floor(lon)
+    )
+    x, y = _transverse_mercator(
+        math.radians(lat), math.radians(lon - central_meridian), math
+    )
+    hemisphere = "S" if lat < 0 else "N"
+    if hemisphere == "S":
+        y += FALSE_NORTHING
+    return zone, band, hemisphere, x + FALSE_EASTING, y
+
+
+def to_utm_arrays(lats, lons):
+    """
+    vectorized to_utm for arrays of positions. Returns arrays of zones,
+    eastings and northings. The northings are falsed for southern positions.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = (np.asarray(lons, dtype=float) + 180) % 360 - 180
+    if np.any((lats < UTM_LAT_MIN) | (lats >= UTM_LAT_MAX)):
+        raise ValueError("latitude outside UTM range.")
+    cells = zip(
+        np.floor(lats).astype(int).tolist(), np.floor(lons).astype(int).tolist()
+    )
+    zones, _, central_meridians = map(
+        np.array, zip(*(get_zone_band(*_cell) for _cell in cells))
+    )
+    x, y = _transverse_mercator(
+        np.radians(lats), np.radians(lons - central_meridians), _numpy_math
+    )
+    y = np.where(lats < 0, y + FALSE_NORTHING, y)
+    return zones, x + FALSE_EASTING, y
+
+
+def format_utm(zone, band, hemisphere, easting, northing):
+    """formats the UTM coordinates like pygeodesy's Utm.toStr()."""
+    return f"{zone:02d} {hemisphere} {easting:.0f} {northing:.0f}"
+
+
+def _split_100km(meter):
+    # truncated to micrometer like pygeodesy before splitting.
+    meter = int(meter / 1e-6) * 1e-6
+    square, meter = divmod(meter, 100e3)
+    return int(square), meter
+
+
+def format_mgrs(zone, band, hemisphere, easting, northing):
+    """
+    formats the MGRS grid reference of the UTM coordinates like pygeodesy's
+    Mgrs.toStr(). Easting and northing are truncated to one meter.
+    """
+    column, easting = _split_100km(easting)
+    row, northing = _split_100km(northing)
+    square = (
+        MGRS_COLUMNS[(zone - 1) % 3][column - 1]
+        + MGRS_ROWS[(zone - 1) % 2][row % 20]
+    )
+    return f"{zone:02d}{band}{square}{int(easting):05d}{int(northing):05d}"
+
+
+def to_utm_mgrs_strings(lat, lon):
+    """returns the UTM and MGRS strings of the position."""
+    utm = to_utm(lat, lon)
+    return format_utm(*utm), format_mgrs(*utm)